@@ -50,6 +50,8 @@ from sage.misc.flatten import flatten
 from sage.misc.functional import log
 
 from .voronoi import FundamentalGroupVoronoi
+from .delaunay import FundamentalGroupDelaunay
+from .multiscale import FundamentalGroupMultiscale
 from .integrator import Integrator
 from .util import Util
 from .context import Context
@@ -90,7 +92,12 @@ class CalabiYauOperator(object):
     @property
     def fundamental_group(self):
         if not hasattr(self, "_fundamental_group"):
-            fundamental_group = FundamentalGroupVoronoi(self.singular_values, self.basepoint)
+            if self.ctx.method == 'delaunay':
+                fundamental_group = FundamentalGroupDelaunay(self.singular_values, self.basepoint)
+            elif self.ctx.method == 'multiscale':
+                fundamental_group = FundamentalGroupMultiscale(self.singular_values, self.basepoint)
+            else:
+                fundamental_group = FundamentalGroupVoronoi(self.singular_values, self.basepoint)
             self._singular_values = [self._singular_values[i] for i in fundamental_group.sort_loops()]
             self._fundamental_group = fundamental_group
         return self._fundamental_group
@@ -202,7 +209,7 @@ class CalabiYauOperator(object):
     @property
     def transition_matrices(self):
         if not hasattr(self, "_transition_matrices"):
-            integrator = Integrator(self.fundamental_group, self.L, self.ctx.nbits)
+            integrator = Integrator(self.fundamental_group, self.L, self.ctx.nbits, cache=self.ctx.edge_cache)
             transition_matrices = integrator.transition_matrices
             if self.L.annihilator_of_composition(1/self.L.base_ring().gen()).leading_coefficient()(0)==0:
                 transition_matrices += [prod(list(reversed(transition_matrices))).inverse()]
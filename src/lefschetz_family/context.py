@@ -19,6 +19,8 @@
 from sage.rings.complex_arb import ComplexBallField
 from sage.rings.complex_mpfr import ComplexField
 
+from .edgeCache import EdgeCache
+
 class Context(object):
 
     def __init__(self,
@@ -29,27 +31,34 @@ class Context(object):
             nbits=200,
             long_fibration=True,
             depth=0,
-            simultaneous_integration=False
+            simultaneous_integration=False,
+            cache_dir=None,
+            max_refinements=3
         ):
         r"""
         Lefschetz Family integration context
 
         Options:
 
-        * ``method`` -- The way the paths are computed, either along a Voronoi diagram of the singularities ("voronoi"), or a Delaunay triangulation of the singularities ("delaunay"). Default is "voronoi"
+        * ``method`` -- The way the paths are computed, either along a Voronoi diagram of the singularities ("voronoi"), along a Voronoi diagram of the singularities whose short edges are contracted, i.e. the dual of their Delaunay triangulation with merged faces ("delaunay"), along the dual of their Delaunay triangulation ("delaunay_dual"), or along Voronoi diagrams built separately for the tight clusters of singularities and for the rest ("multiscale"). Default is "voronoi"
         * ``compute_periods`` -- Whether the algorithm should compute periods of the variety, or stop at homology. Default is True.
         * ``singular`` -- Whether the input variety is expected to be singular. Default is False
+        * ``cache_dir`` -- A directory where the numerical transition matrices along edges are stored, so that they can be reused by later runs. Default is None (no cache)
+        * ``max_refinements`` -- How many times the edges along loops with non-integral monodromy are integrated again with doubled precision before giving up. Default is 3
 
         * (other options still to be documented...)
         """
 
-        if not method in [None, "voronoi", "delaunay_dual"]:
+        if not method in [None, "voronoi", "delaunay", "delaunay_dual", "multiscale"]:
             raise ValueError("method", method)
         self.method = "voronoi" if method==None else method
 
         if not isinstance(singular, bool):
             raise TypeError("singular", type(singular))
         self.singular = singular
+
+        if self.method == "multiscale" and self.singular:
+            raise ValueError("method", method, "multiscale paths do not provide the dual cells needed to desingularise, use another method for singular varieties")
         
         if not isinstance(debug, bool):
             raise TypeError("debug", type(debug))
@@ -71,6 +80,15 @@ class Context(object):
             raise TypeError("use_symmetry", type(use_symmetry))
         self.use_symmetry = use_symmetry
 
+        if not (cache_dir is None or isinstance(cache_dir, str)):
+            raise TypeError("cache_dir", type(cache_dir))
+        self.cache_dir = cache_dir
+        self.edge_cache = EdgeCache(cache_dir) if cache_dir != None else None
+
+        if not isinstance(max_refinements, int):
+            raise TypeError("max_refinements", type(max_refinements))
+        self.max_refinements = max_refinements
+
         # if not isinstance(depth, int):
         #     raise TypeError("depth", type(depth))
         # self.depth = depth
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+# lefschetz-family
+# Copyright (C) 2021  Eric Pichon-Pharabod
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import sage.all
+
+from sage.rings.complex_double import CDF
+from sage.rings.real_double import RDF
+from sage.matrix.constructor import matrix
+from sage.matrix.special import identity_matrix
+from sage.modules.free_module_element import vector
+
+import json
+import logging
+import math
+import os
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+
+class EdgeCostModel(object):
+    # log(duration) is modeled as c0 + c1*log(1+length/distance) + c2*log(order*degree) + c3*log(nbits)
+    default_coefficients = [0, 1, 1, 1]
+    max_samples = 2000
+    min_samples = 8
+
+    def __init__(self, singularities, order, degree, directory=None):
+        """EdgeCostModel(singularities, order, degree, directory=None)
+
+        An estimate of the time needed to integrate a differential operator (or system) of order `order` and degree `degree`,
+        with singular points `singularities`, along an edge.
+        The main factor is the length of the edge relative to its distance to the closest singular point.
+        If `directory` is given, the timings of the integrations are logged there, and the model is calibrated from the timings of earlier runs.
+        """
+        self._singularities = [complex(CDF(s)) for s in singularities]
+        self.order = order
+        self.degree = degree
+        self._directory = directory
+
+    @property
+    def logfile(self):
+        return os.path.join(self._directory, "edge_timings.json") if self._directory != None else None
+
+    def _read_samples(self):
+        if self.logfile == None or not os.path.exists(self.logfile):
+            return []
+        try:
+            with open(self.logfile) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    @property
+    def coefficients(self):
+        """The coefficients of the model, fitted by least squares on the logged timings and regularized towards the default coefficients."""
+        if not hasattr(self, "_coefficients"):
+            samples = self._read_samples()
+            if len(samples) < self.min_samples:
+                self._coefficients = self.default_coefficients
+            else:
+                X = matrix(RDF, [[1] + self._log_features(*s[:4]) for s in samples])
+                y = vector(RDF, [math.log(max(s[4], 1e-3)) for s in samples])
+                c = vector(RDF, self.default_coefficients)
+                self._coefficients = list((X.transpose()*X + identity_matrix(RDF, 4)).solve_right(X.transpose()*y + c))
+                logger.info("Calibrated edge cost model from %d timings: %s."% (len(samples), str(self._coefficients)))
+        return self._coefficients
+
+    def _log_features(self, ratio, order, degree, nbits):
+        return [math.log(1+ratio), math.log(order*max(degree, 1)), math.log(nbits)]
+
+    def ratio(self, l):
+        """The length of the segment l relative to its distance to the closest singularity."""
+        a, b = complex(CDF(l[0])), complex(CDF(l[1]))
+        length = abs(b-a)
+        distance = min([self._distance_to_segment(s, a, b) for s in self._singularities], default=length)
+        return length / max(distance, length*1e-6, 1e-30)
+
+    @classmethod
+    def _distance_to_segment(cls, s, a, b):
+        if a == b:
+            return abs(s-a)
+        t = ((s-a)*(b-a).conjugate()).real/abs(b-a)**2
+        t = min(max(t, 0), 1)
+        return abs(s - (a + t*(b-a)))
+
+    def estimate(self, l, nbits):
+        """Estimated time (in seconds once calibrated) needed to integrate along the segment l with precision `nbits`."""
+        c = self.coefficients
+        f = self._log_features(self.ratio(l), self.order, self.degree, nbits)
+        return math.exp(c[0] + sum([ci*fi for ci, fi in zip(c[1:], f)]))
+
+    def schedule(self, edges, precisions, nworkers):
+        """Given a list of edges and their precisions, returns the pair (tasks, npieces), where `tasks` is a list of tuples (k, j, path, nbits),
+        meaning that the j-th piece of the k-th edge is the segment `path`, ordered by decreasing estimated cost;
+        and npieces[k] is the number of pieces the k-th edge is split in.
+        Edges more expensive than the average load of a worker are split in subsegments, so that they do not delay the whole computation.
+        """
+        costs = [self.estimate(e, nbits) for e, nbits in zip(edges, precisions)]
+        load = sum(costs)/nworkers
+        tasks, npieces = [], []
+        for k, (e, nbits) in enumerate(zip(edges, precisions)):
+            n = min(nworkers, math.ceil(costs[k]/load)) if nworkers>1 and len(edges)>0 and costs[k]>load else 1
+            if n>1:
+                logger.info("Splitting edge %d in %d pieces (estimated cost: %.2f, average load: %.2f)."% (k, n, costs[k], load))
+            points = [e[0] + (e[1]-e[0])*j/n for j in range(n)] + [e[1]]
+            for j in range(n):
+                path = [points[j], points[j+1]]
+                tasks += [(k, j, path, nbits, self.estimate(path, nbits))]
+            npieces += [n]
+        tasks.sort(key=lambda t:-t[4])
+        return [t[:4] for t in tasks], npieces
+
+    def record(self, timings):
+        """Logs the timings, given as a list of triples (path, nbits, duration), for the calibration of later runs."""
+        if self.logfile == None or len(timings)==0:
+            return
+        samples = self._read_samples()
+        samples += [[self.ratio(l), self.order, self.degree, nbits, duration] for l, nbits, duration in timings]
+        samples = samples[-self.max_samples:]
+        fd, temp = tempfile.mkstemp(dir=self._directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(samples, f)
+        os.replace(temp, self.logfile)
@@ -18,139 +18,129 @@
 
 import sage.all
 
-from sage.rings.complex_mpfr import ComplexField
-from sage.graphs.graph import Graph
-from sage.rings.imaginary_unit import I
-from sage.functions.other import arg
-
+from sage.rings.rational_field import QQ
 from sage.misc.flatten import flatten
 
-class FundamentalGroupDelaunay(object):
-    def __init__(self, points, basepoint):
-        assert basepoint not in points
+import heapq
+import logging
 
-        self._points = [basepoint] + points
+from .voronoi import FundamentalGroupVoronoi
+from .costModel import EdgeCostModel
 
-        self.CC = ComplexField(500)
+logger = logging.getLogger(__name__)
 
+class FundamentalGroupDelaunay(FundamentalGroupVoronoi):
+    # the positions on a contracted edge (as a fraction of its length) among which the new vertex is chosen
+    positions = [QQ(1)/2, QQ(1)/4, QQ(3)/4, QQ(0), QQ(1)]
 
-    @property
-    def points(self):
-        return self._points
+    def __init__(self, points, basepoint, border=5):
+        """FundamentalGroupDelaunay(points, basepoint, border=5)
 
-    @property
-    def basepoint(self):
-        return self.points[0]
+        Paths along the dual of the Delaunay triangulation of the critical points, in which adjacent faces are merged.
+        Merging two faces contracts the edge of the Voronoi graph dual to their common side to a single vertex, of degree four or more.
+        As with FundamentalGroupVoronoi, each loop goes once around the cell of its critical point and neighbouring loops share the edges between their cells,
+        but each merge removes one edge. Two faces are merged only if the cells stay star shaped around their critical points,
+        and if the estimated cost of the new edges is not more than the cost of the former ones.
+        """
+        super().__init__(points, basepoint, border=border)
 
     @property
-    def npoints(self):
-        return len(self.points)
-    
+    def polygons(self):
+        if not hasattr(self, "_merged"):
+            super().polygons
+            self._merge_cells()
+        return self._polygons
 
     @property
-    def minimal_graph(self):
-        if not hasattr(self, '_minimal_graph'):
-            tree = Graph(self.npoints) 
-            edges = flatten([[(i,j) for i in range(j)] for j in range(self.npoints)], max_level=1) 
-            edges.sort(key=(lambda e: abs(self.CC(self.points[e[0]])-self.CC(self.points[e[1]])))) # we sort edges by length
+    def merged(self):
+        """The number of edges of the Voronoi graph that were contracted."""
+        self.polygons
+        return self._merged
+
+    @classmethod
+    def _cross(cls, z, w):
+        return (z.conjugate()*w).imag
+
+    @classmethod
+    def _cost(cls, a, b, sites):
+        """The estimated cost of integrating along the segment [a, b], bounding the cells of `sites` (see FundamentalGroupVoronoi.edge_costs)."""
+        distance = min([EdgeCostModel._distance_to_segment(s, a, b) for s in sites])
+        return 1 + abs(b-a)/max(distance, 1e-30)
+
+    def _merge_cells(self):
+        """Contracts the edges of the Voronoi graph shared by two cells of critical points, shortest first.
+        The vertices of the cell of the basepoint are kept."""
+        polygons, vertices = self._polygons, self._vertices
+        coordinates = [complex(self.CC(z)) for z in vertices]
+        sites = [complex(self.CC(c)) for c, _ in polygons]
+        edge_cells = {}
+        for k, (c, edges) in enumerate(polygons):
             for e in edges:
-                if len(tree.shortest_path(e[0], e[1]))==0:
-                    tree.add_edge(e)
-            self._minimal_graph = tree
-
-        return self._minimal_graph
-
-    
-    @property
-    def neighbours(self):
-        if not hasattr(self, '_neighbours'):
-            smallangleshift = -I/100000000000 # this assumes there are no angle very close to -pi, so we can send angles equal to -pi below the line
-            neighbours=[[] for vertex in self.minimal_graph.vertices()]
-            for vertex in self.minimal_graph.vertices():
-                l = self.minimal_graph.neighbors(vertex)
-                l.sort(key=lambda v2:arg(self.CC(self.points[v2] - self.points[vertex] + smallangleshift/abs(self.CC(self.points[v2] - self.points[vertex])))))
-                neighbours[vertex] = l
-            self._neighbours = neighbours
-        return self._neighbours
-
-    def _visit_neighbours(self, vertex, parent):
-        neighbours = self.neighbours[vertex]
-        if len(neighbours) == 1:
-            return [[vertex]]
-        assert parent in neighbours, "parent node is not a neighbour"
-
-        prefix=[vertex]
-        index_parent = neighbours.index(parent)
-
-        i=index_parent+1
-        if i==len(neighbours):
-            i=0
-            prefix=[vertex, "loop"]
-        paths=[]
-        while i != index_parent:
-            paths = paths+[prefix+path_child for path_child in self._visit_neighbours(neighbours[i], vertex)]
-            i=i+1
-            if i == len(neighbours):
-                i=0
-                prefix=[vertex, "loop"]
-        return paths + [[vertex]]
-
-    @property
-    def paths(self):
-        if not hasattr(self, "_paths"):
-            paths = []
-            for vertex in self.neighbours[0]:
-                paths= paths + self._visit_neighbours(vertex, 0)
-            paths = [[0]+path for path in paths]
-            self._paths = paths
-        return self._paths
-    
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+                edge_cells.setdefault((e[0], e[1]), []).append(k)
+        vertex_edges = {}
+        for e in edge_cells:
+            for v in e:
+                vertex_edges.setdefault(v, []).append(e)
+
+        kept = set([0] + flatten(polygons[0][1]))
+        candidates = [e for e, cells in edge_cells.items() if len(cells) == 2 and 0 not in cells]
+        candidates = [(abs(coordinates[e[0]] - coordinates[e[1]]), e) for e in candidates]
+        heapq.heapify(candidates)
+        merged = 0
+        while len(candidates) > 0:
+            _, (a, b) = heapq.heappop(candidates)
+            if a in kept or b in kept or (a, b) not in edge_cells:
+                continue
+            moved = [(e, v) for v in (a, b) for e in vertex_edges[v] if e != (a, b)]
+            ends = [e[0] if e[1] == v else e[1] for e, v in moved]
+            if len(set(ends)) < len(ends): # a triangular cell would become degenerate
+                continue
+            old_cost = self._cost(coordinates[a], coordinates[b], [sites[k] for k in edge_cells[(a, b)]])
+            for (e, v), u in zip(moved, ends):
+                old_cost += self._cost(coordinates[u], coordinates[v], [sites[k] for k in edge_cells[e]])
+            best = None
+            for t in self.positions:
+                zm = coordinates[a] + float(t)*(coordinates[b] - coordinates[a])
+                new_cost = 0
+                for (e, v), u in zip(moved, ends):
+                    zu, zv = coordinates[u], coordinates[v]
+                    for k in edge_cells[e]:
+                        s = sites[k]
+                        if self._cross(zu - s, zv - s)*self._cross(zu - s, zm - s) <= 0:
+                            new_cost = None
+                            break
+                    if new_cost == None:
+                        break
+                    new_cost += self._cost(zu, zm, [sites[k] for k in edge_cells[e]])
+                if new_cost != None and new_cost <= old_cost and (best == None or new_cost < best[0]):
+                    best = (new_cost, t, zm)
+            if best == None:
+                continue
+
+            new_cost, t, zm = best
+            m = len(vertices)
+            vertices += [vertices[a] + t*(vertices[b] - vertices[a])]
+            coordinates += [zm]
+            for k in edge_cells.pop((a, b)):
+                polygons[k][1].remove([a, b])
+            vertex_edges[m] = []
+            for (e, v), u in zip(moved, ends):
+                cells = edge_cells.pop(e)
+                vertex_edges[u].remove(e)
+                edge_cells[(u, m)] = cells
+                vertex_edges[u] += [(u, m)]
+                vertex_edges[m] += [(u, m)]
+                for k in cells:
+                    polygons[k][1].remove([e[0], e[1]])
+                    polygons[k][1].append([u, m])
+                if len(cells) == 2 and 0 not in cells:
+                    heapq.heappush(candidates, (abs(coordinates[u] - zm), (u, m)))
+            merged += 1
+
+        # the contracted vertices are dropped
+        used = sorted(set([0] + flatten([edges for c, edges in polygons])))
+        index = {v:i for i, v in enumerate(used)}
+        self._vertices = [vertices[v] for v in used]
+        self._polygons = [[c, [[index[e[0]], index[e[1]]] for e in edges]] for c, edges in polygons]
+        self._merged = merged
+        logger.info("Contracted %d edges of the Voronoi graph, %d vertices are left."% (merged, len(self._vertices)))
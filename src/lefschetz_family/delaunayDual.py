@@ -22,7 +22,6 @@ from sage.rings.rational_field import QQ
 from sage.rings.complex_mpfr import ComplexField
 from sage.graphs.graph import Graph
 from sage.rings.imaginary_unit import I
-from sage.functions.other import arg
 
 from sage.misc.flatten import flatten
 
@@ -32,6 +31,8 @@ from delaunay_triangulation import triangulate
 import os
 
 from .util import Util
+from .spatialIndex import SpatialIndex
+from .planarGraph import PlanarGraph
 
 class FundamentalGroupDelaunayDual(object):
     def __init__(self, points, basepoint, border=5):
@@ -88,9 +89,11 @@ class FundamentalGroupDelaunayDual(object):
         """
         if not hasattr(self, "_edges"):
             edges = []
+            seen = set()
             for center, polygon in self.polygons:
                 for e in polygon:
-                    if e not in edges and [e[1], e[0]] not in edges:
+                    if (e[0], e[1]) not in seen:
+                        seen.update([(e[0], e[1]), (e[1], e[0])])
                         edges += [e]
             connection_to_basepoint = min([i for i in range(1, len(self.vertices))], key=lambda i: abs(self.vertices[0] - self.vertices[i]))
             edges += [[0, connection_to_basepoint]]
@@ -115,6 +118,12 @@ class FundamentalGroupDelaunayDual(object):
             self._graph = Graph([(e[0], e[1], self.rationalize(abs(self.vertices[e[0]] - self.vertices[e[1]]))) for e in self.edges])
         return self._graph
 
+    @property
+    def planar_graph(self):
+        if not hasattr(self, "_planar_graph"):
+            self._planar_graph = PlanarGraph(self.edges, self.vertices)
+        return self._planar_graph
+
     @property
     def tree(self):
         if not hasattr(self, "_tree"):
@@ -181,19 +190,19 @@ class FundamentalGroupDelaunayDual(object):
     def minimal_tree(self):
         if not hasattr(self, "_minimal_tree"):
             edges = []
+            seen = set()
             for path in self.paths:
                 for i in range(len(path)-1):
                     e0 = path[i]
                     e1 = path[i+1]
-                    if [e0,e1] not in edges and [e1,e0] not in edges:
+                    if (e0, e1) not in seen:
+                        seen.update([(e0, e1), (e1, e0)])
                         edges+=[[e0, e1]]
-            self._minimal_tree = Graph(edges)
+            self._minimal_tree = PlanarGraph(edges)
         return self._minimal_tree
 
-    def neighbours(self, v): # maybe this shoudl be done only once?
-        neighbours = self.graph.neighbors(v)
-        neighbours.sort(key=lambda v2:arg(self.vertices[v2] - self.vertices[v]))
-        return neighbours
+    def neighbours(self, v):
+        return self.planar_graph.neighbours(v)
 
     def sort_loops(self):
         order = self._sort_loops_rec(0)
@@ -210,9 +219,7 @@ class FundamentalGroupDelaunayDual(object):
     def adapted_loops(self, subvoronoi): # This is broken.
         for v in subvoronoi.points:
             assert v in self.points
-        correspondance = []
-        for v in subvoronoi.vertices:
-            correspondance += [Util.select_closest_index(self.vertices,v)]
+        correspondance = Util.select_closest_indices(self.vertices, subvoronoi.vertices)
         adapted_loops = []
         for loop in subvoronoi.pointed_loops:
             adapted_loop = [correspondance[loop[0]]]
@@ -222,18 +229,22 @@ class FundamentalGroupDelaunayDual(object):
         return adapted_loops
 
 
-    def _sort_loops_rec(self, v, parent=None, depth=0):
+    def _sort_loops_rec(self, v, parent=None, depth=0, loops_at=None):
+        if loops_at == None:
+            self.minimal_tree # the loops start at their loop points once the paths are computed
+            loops_at = {}
+            for i, loop in enumerate(self.loops):
+                loops_at.setdefault(loop[0], []).append((i, loop[1]))
         neighbours = self.neighbours(v)
-        tree_neighbours = self.minimal_tree.neighbors(v)
-        loops = [(i, loop[1]) for i, loop in enumerate(self.loops) if loop[0]==v]
+        loops = loops_at.get(v, [])
         if parent!=None:
             index = neighbours.index(parent)
             neighbours = neighbours[index:] + neighbours[:index]
 
         order = []
         for child in neighbours:
-            if child!= parent and child in tree_neighbours:
-                order+=self._sort_loops_rec(child, v, depth+1)
+            if child!= parent and self.minimal_tree.has_edge(v, child):
+                order+=self._sort_loops_rec(child, v, depth+1, loops_at)
             for loop in loops:
                 if loop[1] == child:
                     order+=[loop[0]]
@@ -274,6 +285,7 @@ class FundamentalGroupDelaunayDual(object):
             self._rootapprox = rootapprox
             
             polygons_temp = [[p, []] for p in rootapprox]
+            rootindex = SpatialIndex(rootapprox)
             
             for triangle in dt:
                 ts = [t.x+I*t.y for t in triangle]
@@ -284,35 +296,38 @@ class FundamentalGroupDelaunayDual(object):
                     middle = (p1+p2)/2
                     edge = [center, middle]
 
-                    v1, v2 = Util.select_closest_index(rootapprox, p1), Util.select_closest_index(rootapprox, p2)
+                    v1, v2 = rootindex.closest_index(p1), rootindex.closest_index(p2)
                     
 
                     for v in [v1, v2]:
                         polygons_temp[v][1]+=[[edge, [v1,v2]]]
 
             # we are only interested in cells around elements of self.points
-            indices = [Util.select_closest_index([center for center, polygon in polygons_temp], c) for c in self.qpoints[1:]]
+            indices = Util.select_closest_indices([center for center, polygon in polygons_temp], self.qpoints[1:])
             polygons_temp = [polygons_temp[i] for i in indices]
 
             # then we translate the edges in rational coordinate as well
             polygons = []
             duality = []
-            all_edges = []
+            all_edges = set()
+            index = {vertices[0]:0}
             for center, polygon in polygons_temp:
                 edges = []
                 for edge, dual in polygon:
                     e0 = self.rationalize(edge[0])
-                    if e0 not in vertices:
+                    if e0 not in index:
+                        index[e0] = len(vertices)
                         vertices += [e0]
                     e1 = self.rationalize(edge[1])
-                    if e1 not in vertices:
+                    if e1 not in index:
+                        index[e1] = len(vertices)
                         vertices += [e1]
                     if e0 != e1:
-                        e = [vertices.index(e0),vertices.index(e1)]
+                        e = [index[e0],index[e1]]
                         edges += [e]
-                        if e not in all_edges and (dual[0] < len(self.points) and dual[1] < len(self.points)):
+                        if (e[0], e[1]) not in all_edges and (dual[0] < len(self.points) and dual[1] < len(self.points)):
                             duality += [[e, dual]]
-                            all_edges += [e]
+                            all_edges.add((e[0], e[1]))
                 polygons += [[center, edges]]
 
             self._vertices = vertices
@@ -45,10 +45,13 @@ from sage.misc.prandom import randint
 
 from .voronoi import FundamentalGroupVoronoi
 from .integrator_simultaneous import IntegratorSimultaneous
+from .integrator_batch import IntegratorBatch
 from .integrator import Integrator
 from .util import Util
 from .context import Context
 from .exceptionalDivisorComputer import ExceptionalDivisorComputer
+from .delaunay import FundamentalGroupDelaunay
+from .multiscale import FundamentalGroupMultiscale
 from .delaunayDual import FundamentalGroupDelaunayDual
 from .hypersurface import Hypersurface
 from .monodromyRepresentationGeneric import MonodromyRepresentationGeneric
@@ -332,7 +335,9 @@ class DoubleCover(object):
                                         nbits=self.ctx.nbits, 
                                         long_fibration=self.ctx.long_fibration, 
                                         depth=self.ctx.depth+1,
-                                        simultaneous_integration=True
+                                        simultaneous_integration=True,
+                                        cache_dir=self.ctx.cache_dir,
+                                        max_refinements=self.ctx.max_refinements
                                         )
 
         return self._fibre
@@ -600,7 +605,7 @@ class DoubleCover(object):
 
         logger.info("[%d] Computing numerical transition matrices for %d integrals (%d edges total)."% (self.dim, rat_coefs[0].nrows(), len(self.fundamental_group.edges)))
         begin = time.time()
-        integrator = IntegratorSimultaneous(self.fundamental_group, rat_coefs, gaussmanin, self.ctx.nbits)
+        integrator = IntegratorSimultaneous(self.fundamental_group, rat_coefs, gaussmanin, self.ctx.nbits, cache=self.ctx.edge_cache)
         transition_matrices = integrator.transition_matrices
         if hasattr(self, '_transition_matrices_holomorphic'):
             Rholo = len(self.holomorphic_forms)
@@ -620,11 +625,13 @@ class DoubleCover(object):
         res = None
         j=0
         logger.info("[%d] Computing Picard-Fuchs equations of %d form(s) in dimension %d"% (self.dim, R.nrows(), self.dim))
-        for i, v in zip(indices, R.rows()):
+        Ls = []
+        for v in R.rows():
             L = self.picard_fuchs_equation(v/denom)
             L = L * L.parent().gens()[0]
-            logger.info("[%d] Integrating operator [%d/%d] with order %d and degree %d."% (self.dim, j+1, R.nrows(), L.order(), L.degree()))
-            integrated = self.integrate(L)
+            Ls += [L]
+        integrated_operators = self.integrate_operators(Ls)
+        for i, L, integrated in zip(indices, Ls, integrated_operators):
             derivatives_at_basepoint = self.derivatives_values_at_basepoint(i)
             integration_correction = diagonal_matrix([1/ZZ(factorial(k)) for k in range(L.order())])
             initial_conditions = ( integration_correction * derivatives_at_basepoint )
@@ -665,10 +672,21 @@ class DoubleCover(object):
         L = DifferentialOperator(L)
         return L
 
+    def integrate_operators(self, Ls):
+        """Computes the numerical transition matrices of all the operators of Ls in a single pass over the edges."""
+        logger.info("[%d] Computing numerical transition matrices of %d operators of orders %s (%d edges total)."% (self.dim, len(Ls), str([L.order() for L in Ls]), len(self.fundamental_group.edges)))
+        begin = time.time()
+        integrator = IntegratorBatch(self.fundamental_group, Ls, self.ctx.nbits, cache=self.ctx.edge_cache)
+        transition_matrices = integrator.transition_matrices
+        end = time.time()
+        duration_str = time.strftime("%H:%M:%S",time.gmtime(end-begin))
+        logger.info("[%d] Integration finished -- total time: %s."% (self.dim, duration_str))
+        return transition_matrices
+
     def integrate(self, L):
         logger.info("[%d] Computing numerical transition matrices of operator of order %d and degree %d (%d edges total)."% (self.dim, L.order(), L.degree(), len(self.fundamental_group.edges)))
         begin = time.time()
-        integrator = Integrator(self.fundamental_group, L, self.ctx.nbits)
+        integrator = Integrator(self.fundamental_group, L, self.ctx.nbits, cache=self.ctx.edge_cache)
         transition_matrices = integrator.transition_matrices
         end = time.time()
         duration_str = time.strftime("%H:%M:%S",time.gmtime(end-begin))
@@ -774,8 +792,12 @@ class DoubleCover(object):
         if not hasattr(self,'_fundamental_group'):
             logger.info("[%d] Computing fundamental group with %d critical values."% (self.dim, len(self.critical_values)))
             begin = time.time()
-            if self.ctx.method == 'voronoi':# access future delaunay implem here
+            if self.ctx.method == 'voronoi':
                 fundamental_group = FundamentalGroupVoronoi(self.critical_values, self.basepoint)
+            elif self.ctx.method == 'delaunay':
+                fundamental_group = FundamentalGroupDelaunay(self.critical_values, self.basepoint)
+            elif self.ctx.method == 'multiscale':
+                fundamental_group = FundamentalGroupMultiscale(self.critical_values, self.basepoint)
             elif self.ctx.method == 'delaunay_dual':
                 fundamental_group = FundamentalGroupDelaunayDual(self.critical_values, self.basepoint)
             else:
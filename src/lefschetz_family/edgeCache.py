@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+# lefschetz-family
+# Copyright (C) 2021  Eric Pichon-Pharabod
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import sage.all
+
+from sage.misc.persist import dumps, loads
+
+import hashlib
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+
+class EdgeCache(object):
+    def __init__(self, directory):
+        """EdgeCache(directory)
+
+        A content-addressed store of numerical transition matrices along edges, kept in `directory`.
+        Entries are keyed by a normalized form of the operator (or differential system) and the exact endpoints of the edge.
+        Each entry keeps the transition matrices computed at the various precisions, and a matrix computed with precision `nbits`
+        answers any request for a precision lower than `nbits`.
+        """
+        self._directory = os.path.expanduser(directory)
+        os.makedirs(self._directory, exist_ok=True)
+
+    @property
+    def directory(self):
+        return self._directory
+
+    @classmethod
+    def _digest(cls, *parts):
+        return hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+    @classmethod
+    def operator_key(cls, L):
+        """Given a differential operator L, returns a key depending only on the operator up to multiplication by a constant."""
+        c = L.leading_coefficient().leading_coefficient()
+        coefficients = [a/c for a in L.list()]
+        return cls._digest("operator", *[repr(a) for a in coefficients])
+
+    @classmethod
+    def operators_key(cls, Ls):
+        """Given a list of differential operators, returns a key depending only on the operators up to multiplication by constants."""
+        return cls._digest("operators", *[cls.operator_key(L) for L in Ls])
+
+    @classmethod
+    def system_key(cls, A, denA, R, denR):
+        """Given the Gauss-Manin system A/denA and the integrands R/denR, returns a key depending only on the rational matrices A/denA and R/denR."""
+        cA = denA.leading_coefficient()
+        cR = denR.leading_coefficient()
+        parts = ["system"] + [repr(a/cA) for a in A.list()] + [repr(denA/cA)]
+        parts += ["integrands"] + [repr(r/cR) for r in R.list()] + [repr(denR/cR)]
+        return cls._digest(*parts)
+
+    def _filename(self, key, l):
+        return os.path.join(self.directory, self._digest(key, *[repr(z) for z in l]) + ".sobj")
+
+    def _read(self, filename):
+        try:
+            with open(filename, "rb") as f:
+                return loads(f.read())
+        except (OSError, EOFError, ValueError):
+            return {}
+
+    def get(self, key, l, nbits):
+        """Returns a transition matrix along the path l for the operator with key `key` with precision at least `nbits`, or None if there is none."""
+        filename = self._filename(key, l)
+        if not os.path.exists(filename):
+            return None
+        entries = self._read(filename)
+        precisions = [p for p in entries if p>=nbits]
+        if len(precisions)==0:
+            return None
+        return entries[min(precisions)]
+
+    def put(self, key, l, nbits, ntm):
+        """Stores the transition matrix `ntm` along the path l, computed with precision `nbits`, for the operator with key `key`."""
+        filename = self._filename(key, l)
+        entries = self._read(filename)
+        entries[nbits] = ntm
+        # writing to a temporary file first so that concurrent workers never read a partial entry
+        fd, temp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(dumps(entries))
+        os.replace(temp, filename)
@@ -42,6 +42,8 @@ from sage.misc.flatten import flatten
 from sage.modules.free_quadratic_module_integer_symmetric import IntegralLattice
 
 from .voronoi import FundamentalGroupVoronoi
+from .delaunay import FundamentalGroupDelaunay
+from .multiscale import FundamentalGroupMultiscale
 from .integrator import Integrator
 from .util import Util
 from .context import Context
@@ -221,7 +223,7 @@ class EllipticSurface(object):
     @property
     def fibre(self):
         if not hasattr(self,'_fibre'):
-            self._fibre = Hypersurface(self.P(self.basepoint), nbits=self.ctx.nbits, fibration=self._fibration)
+            self._fibre = Hypersurface(self.P(self.basepoint), nbits=self.ctx.nbits, fibration=self._fibration, cache_dir=self.ctx.cache_dir)
             if self._fibre.intersection_product == matrix([[0,-1], [1,0]]):
                 del self._fibre._monodromy_representation
                 self._fibre.monodromy_representation._extensions_desingularisation = list(reversed(self._fibre.monodromy_representation.extensions_desingularisation))
@@ -322,7 +324,7 @@ class EllipticSurface(object):
         logger.info("Computing numerical transition matrices of operator of order %d and degree %d (%d edges total)."% (L.order(), L.degree(), len(self.fundamental_group.edges)))
         begin = time.time()
 
-        integrator = Integrator(self.fundamental_group, L, self.ctx.nbits)
+        integrator = Integrator(self.fundamental_group, L, self.ctx.nbits, cache=self.ctx.edge_cache)
         transition_matrices = integrator.transition_matrices
         
         end = time.time()
@@ -379,7 +381,12 @@ class EllipticSurface(object):
         if not hasattr(self,'_fundamental_group'):
             begin = time.time()
 
-            fundamental_group = FundamentalGroupVoronoi(self.critical_values, self.basepoint) # access future delaunay implem here
+            if self.ctx.method == 'delaunay':
+                fundamental_group = FundamentalGroupDelaunay(self.critical_values, self.basepoint)
+            elif self.ctx.method == 'multiscale':
+                fundamental_group = FundamentalGroupMultiscale(self.critical_values, self.basepoint)
+            else:
+                fundamental_group = FundamentalGroupVoronoi(self.critical_values, self.basepoint)
             fundamental_group.sort_loops()
 
             end = time.time()
@@ -84,7 +84,10 @@ class ExceptionalDivisorComputer(object):
         if not hasattr(self, "_fundamental_group_critical"):
             u, t = self.Qu.gens()
             double_roots = self.Qt((self.critical_values_polynomial*(t-self.variety.fibre.basepoint)).discriminant(t)(u=t)).roots(QQbar, multiplicities=False)
-            fg= FundamentalGroupVoronoi(double_roots,self.variety.basepoint)
+            if isinstance(self.variety.fundamental_group, FundamentalGroupVoronoi): # the critical values of the variety are among the double roots
+                fg = self.variety.fundamental_group.extend(double_roots)
+            else:
+                fg= FundamentalGroupVoronoi(double_roots,self.variety.basepoint)
             fg.sort_loops()
             self._fundamental_group_critical = fg
         return self._fundamental_group_critical
@@ -149,7 +152,10 @@ class ExceptionalDivisorComputer(object):
             xmin=Util.simple_rational(min([s.real() for s in self.marking_init]), 0.000001)
             ymax=Util.simple_rational(max([s.imag() for s in self.marking_init]), 0.000001)
             fake_basepoint = 2*xmin-xmax+ymax*I/5
-            fundamental_group_fibre = FundamentalGroupVoronoi(self.variety.fibre.critical_values + [self.variety.fibre.basepoint], fake_basepoint)
+            if isinstance(self.variety.fibre.fundamental_group, FundamentalGroupVoronoi): # the basepoint of the fibre becomes one of the points
+                fundamental_group_fibre = self.variety.fibre.fundamental_group.extend(self.variety.fibre.critical_values + [self.variety.fibre.basepoint], fake_basepoint)
+            else:
+                fundamental_group_fibre = FundamentalGroupVoronoi(self.variety.fibre.critical_values + [self.variety.fibre.basepoint], fake_basepoint)
             fundamental_group_fibre.sort_loops()
             self._fundamental_group_fibre = fundamental_group_fibre
         return self._fundamental_group_fibre
@@ -161,10 +167,11 @@ class ExceptionalDivisorComputer(object):
             spec_f = [fibre_translator.specialize_path(path) for path in self.variety.fibre.fundamental_group.pointed_loops]
             fakebp = self.fundamental_group_fibre.points[0]
             
-            s_to_FG = [Util.select_closest_index(self.fundamental_group_fibre.points, s) for s in self.marking_init+[fakebp]]
-            edges = [list(e[:2]) for e in self.roots_braid.minimal_cover_tree(self.marking_init).edges()]
+            s_to_FG = Util.select_closest_indices(self.fundamental_group_fibre.points, self.marking_init+[fakebp])
+            minimal_cover_tree = self.roots_braid.minimal_cover_tree(self.marking_init)
+            edges = [list(e[:2]) for e in minimal_cover_tree.edges()]
             for i, e in enumerate(edges): # orient the edges away from basepoint
-                if self.roots_braid.minimal_cover_tree(self.marking_init).distance(e[1], self.roots_braid.npoints) < self.roots_braid.minimal_cover_tree(self.marking_init).distance(e[0],self.roots_braid.npoints):
+                if minimal_cover_tree.distance(e[1], self.roots_braid.npoints) < minimal_cover_tree.distance(e[0],self.roots_braid.npoints):
                     edges[i] = list(reversed(e))
             mtc_init = [[s_to_FG[i] for i in e] for e in edges]
 
@@ -18,4 +18,11 @@ class FailFast(Exception):
     pass
 
 class NotSmoothError(Exception):
-    pass
\ No newline at end of file
+    pass
+
+class PrecisionLossError(Exception):
+    """Raised when the numerical transition matrices along some loops are not precise enough to recover exact data.
+    The indices of the offending loops are stored in `loops`."""
+    def __init__(self, message, loops=None):
+        super().__init__(message)
+        self.loops = loops if loops is not None else []
@@ -108,7 +108,10 @@ class FiberedProduct(object):
     @property
     def fundamental_group(self):
         if not hasattr(self,'_fundamental_group'):
-            fundamental_group = FundamentalGroupVoronoi([e for e in self.critical_values if e!= 'infinity'], self.basepoint)
+            if isinstance(self.S1.fundamental_group, FundamentalGroupVoronoi): # the critical values of S2 are inserted in the Voronoi graph of S1
+                fundamental_group = self.S1.fundamental_group.extend([e for e in self.critical_values if e!= 'infinity'])
+            else:
+                fundamental_group = FundamentalGroupVoronoi([e for e in self.critical_values if e!= 'infinity'], self.basepoint)
             fundamental_group.sort_loops()
             self._critical_values = fundamental_group.points[1:]
             self._fundamental_group = fundamental_group
@@ -161,7 +164,7 @@ class FiberedProduct(object):
         logger.info("Computing numerical transition matrices of operator of order %d and degree %d (%d edges total)."% (L.order(), L.degree(), len(self.fundamental_group.edges)))
         begin = time.time()
 
-        integrator = Integrator(self.fundamental_group, L, self.ctx.nbits)
+        integrator = Integrator(self.fundamental_group, L, self.ctx.nbits, cache=self.ctx.edge_cache)
         transition_matrices = integrator.transition_matrices
         
         end = time.time()
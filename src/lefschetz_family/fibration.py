@@ -32,6 +32,8 @@ from sage.matrix.special import block_diagonal_matrix
 from sage.misc.misc_c import prod
 
 from .voronoi import FundamentalGroupVoronoi
+from .delaunay import FundamentalGroupDelaunay
+from .multiscale import FundamentalGroupMultiscale
 from .integrator import Integrator
 from .util import Util
 from .context import Context
@@ -176,7 +178,7 @@ class Fibration(object):
     @property
     def fibre(self):
         if not hasattr(self,'_fibre'):
-            self._fibre = Hypersurface(self.P(self.basepoint), nbits=self.ctx.nbits, fibration=self._fibration)
+            self._fibre = Hypersurface(self.P(self.basepoint), nbits=self.ctx.nbits, fibration=self._fibration, cache_dir=self.ctx.cache_dir)
         return self._fibre
     
     @property
@@ -210,7 +212,7 @@ class Fibration(object):
         logger.info("Computing numerical transition matrices of operator of order %d and degree %d (%d edges total)."% (L.order(), L.degree(), len(self.fundamental_group.edges)))
         begin = time.time()
 
-        integrator = Integrator(self.fundamental_group, L, self.ctx.nbits)
+        integrator = Integrator(self.fundamental_group, L, self.ctx.nbits, cache=self.ctx.edge_cache)
         transition_matrices = integrator.transition_matrices
         
         end = time.time()
@@ -238,7 +240,12 @@ class Fibration(object):
         if not hasattr(self,'_fundamental_group'):
             begin = time.time()
 
-            fundamental_group = FundamentalGroupVoronoi(self.critical_values, self.basepoint) # access future delaunay implem here
+            if self.ctx.method == 'delaunay':
+                fundamental_group = FundamentalGroupDelaunay(self.critical_values, self.basepoint)
+            elif self.ctx.method == 'multiscale':
+                fundamental_group = FundamentalGroupMultiscale(self.critical_values, self.basepoint)
+            else:
+                fundamental_group = FundamentalGroupVoronoi(self.critical_values, self.basepoint)
             fundamental_group.sort_loops()
 
             end = time.time()
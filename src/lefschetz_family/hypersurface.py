@@ -49,13 +49,18 @@ from sage.misc.prandom import randint
 
 from .voronoi import FundamentalGroupVoronoi
 from .integrator_simultaneous import IntegratorSimultaneous
+from .integrator_batch import IntegratorBatch
 from .integrator import Integrator
 from .util import Util
 from .context import Context
 from .exceptionalDivisorComputer import ExceptionalDivisorComputer
+from .delaunay import FundamentalGroupDelaunay
+from .multiscale import FundamentalGroupMultiscale
 from .delaunayDual import FundamentalGroupDelaunayDual
 from .monodromyRepresentationGeneric import MonodromyRepresentationGeneric
 from .monodromyRepresentationSurface import MonodromyRepresentationSurface
+from .edgeCache import EdgeCache
+from .exceptions import PrecisionLossError
 
 import logging
 import time
@@ -292,13 +297,26 @@ class Hypersurface(object):
                 cohomology_monodromies = [block_diagonal_matrix([M, identity_matrix(1)]) for M in cohomology_monodromies]
 
             Ms = [(self.fibre.period_matrix.inverse() * M * self.fibre.period_matrix) for M in cohomology_monodromies]
-            try:
-                Ms = [M.change_ring(ZZ) for M in Ms]
-            except:
+            imprecise = []
+            for i, M in enumerate(Ms):
+                try:
+                    M.change_ring(ZZ)
+                except (ValueError, TypeError):
+                    imprecise += [i]
+            if not hasattr(self, '_refinements'):
+                self._refinements = 0
+            if len(imprecise)>0 and self._refinements < self.ctx.max_refinements:
+                logger.info("[%d] Monodromy is not integral along loops %s, integrating the corresponding edges with more precision."% (self.dim, str(imprecise)))
+                self._refinements += 1
+                self._refine_loops(imprecise)
+                return self.monodromy_matrices
+            if len(imprecise)>0:
                 if self.ctx.debug:
                     logger.info("Monodromy is not integral")
                 else:
-                    raise Exception("Monodromy is not integral")
+                    raise PrecisionLossError("Monodromy is not integral along loops %s"% str(imprecise), imprecise)
+            else:
+                Ms = [M.change_ring(ZZ) for M in Ms]
                 
             if not self.ctx.singular and not self.ctx.debug:
                 for M in Ms:
@@ -321,7 +339,9 @@ class Hypersurface(object):
                                        nbits=self.ctx.nbits, 
                                        long_fibration=self.ctx.long_fibration, 
                                        depth=self.ctx.depth+1,
-                                       simultaneous_integration=True
+                                       simultaneous_integration=True,
+                                       cache_dir=self.ctx.cache_dir,
+                                       max_refinements=self.ctx.max_refinements
                                        )
 
         return self._fibre
@@ -527,6 +547,7 @@ class Hypersurface(object):
                 indices = [i for i in range(len(self.cohomology))]
                 transition_matrices = self._compute_transition_matrices_sequential(rat_coefs, indices)
             self._transition_matrices = transition_matrices
+            self.transition_matrices_history += ['_transition_matrices']
         return self._transition_matrices
 
     @property
@@ -548,6 +569,7 @@ class Hypersurface(object):
                     indices = [i for i in range(len(self.holomorphic_forms))]
                     transition_matrices = self._compute_transition_matrices_sequential(rat_coefs, indices)
             self._transition_matrices_holomorphic = transition_matrices
+            self.transition_matrices_history += ['_transition_matrices_holomorphic']
         return self._transition_matrices_holomorphic
 
     @property
@@ -568,8 +590,36 @@ class Hypersurface(object):
                 transition_matrices = self._compute_transition_matrices_sequential(rat_coefs, indices)
                 transition_matrices = [M.submatrix(1,1) for M in transition_matrices]
             self._transition_matrices_monodromy = transition_matrices
+            self.transition_matrices_history += ['_transition_matrices_monodromy']
         return self._transition_matrices_monodromy
 
+    @property
+    def transition_matrices_history(self):
+        """The names of the transition matrices attributes that have been computed, in the order in which they were computed."""
+        if not hasattr(self, '_transition_matrices_history'):
+            self._transition_matrices_history = []
+        return self._transition_matrices_history
+
+    @property
+    def integrators(self):
+        """The integrators used so far, indexed by the key of the operator or system they integrate."""
+        if not hasattr(self, '_integrators'):
+            self._integrators = {}
+        return self._integrators
+
+    def _refine_loops(self, loops):
+        """Integrates again with more precision the edges along the loops of index in `loops`, 
+        and recomputes the transition matrices, reusing the other edges."""
+        for integrator in self.integrators.values():
+            integrator.refine(loops)
+        history = self.transition_matrices_history
+        self._transition_matrices_history = []
+        for attr in history + ['_integrated_thimbles', '_integrated_thimbles_holomorphic']:
+            if hasattr(self, attr):
+                delattr(self, attr)
+        for attr in history:
+            getattr(self, attr[1:])
+
     def _compute_transition_matrices_simultaneous(self, rat_coefs):
         logger.info("[%d] Computing Gauss-Manin connection."% (self.dim))
         begin = time.time()
@@ -580,8 +630,10 @@ class Hypersurface(object):
 
         logger.info("[%d] Computing numerical transition matrices for %d integrals (%d edges total)."% (self.dim, rat_coefs[0].nrows(), len(self.fundamental_group.edges)))
         begin = time.time()
-        integrator = IntegratorSimultaneous(self.fundamental_group, rat_coefs, gaussmanin, self.ctx.nbits)
-        transition_matrices = integrator.transition_matrices
+        key = EdgeCache.system_key(*gaussmanin, *rat_coefs)
+        if key not in self.integrators:
+            self.integrators[key] = IntegratorSimultaneous(self.fundamental_group, rat_coefs, gaussmanin, self.ctx.nbits, cache=self.ctx.edge_cache)
+        transition_matrices = self.integrators[key].transition_matrices
         if hasattr(self, '_transition_matrices_holomorphic'):
             Rholo = len(self.holomorphic_forms)
             R = len(self.cohomology) - Rholo
@@ -600,11 +652,13 @@ class Hypersurface(object):
         res = None
         j=0
         logger.info("[%d] Computing Picard-Fuchs equations of %d form(s) in dimension %d"% (self.dim, R.nrows(), self.dim))
-        for i, v in zip(indices, R.rows()):
+        Ls = []
+        for v in R.rows():
             L = self.picard_fuchs_equation(v/denom)
             L = L * L.parent().gens()[0]
-            logger.info("[%d] Integrating operator [%d/%d] with order %d and degree %d."% (self.dim, j+1, R.nrows(), L.order(), L.degree()))
-            integrated = self.integrate(L)
+            Ls += [L]
+        integrated_operators = self.integrate_operators(Ls)
+        for i, L, integrated in zip(indices, Ls, integrated_operators):
             derivatives_at_basepoint = self.derivatives_values_at_basepoint(i)
             integration_correction = diagonal_matrix([1/ZZ(factorial(k)) for k in range(L.order())])
             initial_conditions = ( integration_correction * derivatives_at_basepoint )
@@ -630,11 +684,26 @@ class Hypersurface(object):
         L = DifferentialOperator(L)
         return L
 
+    def integrate_operators(self, Ls):
+        """Computes the numerical transition matrices of all the operators of Ls in a single pass over the edges."""
+        logger.info("[%d] Computing numerical transition matrices of %d operators of orders %s (%d edges total)."% (self.dim, len(Ls), str([L.order() for L in Ls]), len(self.fundamental_group.edges)))
+        begin = time.time()
+        key = EdgeCache.operators_key(Ls)
+        if key not in self.integrators:
+            self.integrators[key] = IntegratorBatch(self.fundamental_group, Ls, self.ctx.nbits, cache=self.ctx.edge_cache)
+        transition_matrices = self.integrators[key].transition_matrices
+        end = time.time()
+        duration_str = time.strftime("%H:%M:%S",time.gmtime(end-begin))
+        logger.info("[%d] Integration finished -- total time: %s."% (self.dim, duration_str))
+        return transition_matrices
+
     def integrate(self, L):
         logger.info("[%d] Computing numerical transition matrices of operator of order %d and degree %d (%d edges total)."% (self.dim, L.order(), L.degree(), len(self.fundamental_group.edges)))
         begin = time.time()
-        integrator = Integrator(self.fundamental_group, L, self.ctx.nbits)
-        transition_matrices = integrator.transition_matrices
+        key = EdgeCache.operator_key(L)
+        if key not in self.integrators:
+            self.integrators[key] = Integrator(self.fundamental_group, L, self.ctx.nbits, cache=self.ctx.edge_cache)
+        transition_matrices = self.integrators[key].transition_matrices
         end = time.time()
         duration_str = time.strftime("%H:%M:%S",time.gmtime(end-begin))
         logger.info("[%d] Integration finished -- total time: %s."% (self.dim, duration_str))
@@ -728,8 +797,12 @@ class Hypersurface(object):
         if not hasattr(self,'_fundamental_group'):
             logger.info("[%d] Computing fundamental group with %d critical values."% (self.dim, len(self.critical_values)))
             begin = time.time()
-            if self.ctx.method == 'voronoi':# access future delaunay implem here
+            if self.ctx.method == 'voronoi':
                 fundamental_group = FundamentalGroupVoronoi(self.critical_values, self.basepoint)
+            elif self.ctx.method == 'delaunay':
+                fundamental_group = FundamentalGroupDelaunay(self.critical_values, self.basepoint)
+            elif self.ctx.method == 'multiscale':
+                fundamental_group = FundamentalGroupMultiscale(self.critical_values, self.basepoint)
             elif self.ctx.method == 'delaunay_dual':
                 fundamental_group = FundamentalGroupDelaunayDual(self.critical_values, self.basepoint)
             else:
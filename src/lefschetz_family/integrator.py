@@ -21,12 +21,18 @@ import sage.all
 from ore_algebra import *
 
 from sage.matrix.special import identity_matrix
-from sage.parallel.decorate import parallel
 from ore_algebra.analytic.differential_operator import DifferentialOperator
+from ore_algebra.analytic.accuracy import PrecisionError
+from ore_algebra.analytic.bounds import BoundPrecisionError
 
 from sage.rings.integer_ring import Z
 
 from .util import Util
+from .edgeCache import EdgeCache
+from .workerPool import WorkerPool
+from .costModel import EdgeCostModel
+from .loopAssembler import LoopAssembler
+from .symmetry import Symmetry
 
 import logging
 import os
@@ -35,113 +41,235 @@ import time
 logger = logging.getLogger(__name__)
 
 
-class Integrator(object):
-    def __init__(self, path_structure, operator, nbits):
+class EdgeIntegrator(object):
+    """The integration of the edges of a path structure, shared by Integrator and IntegratorSimultaneous.
+    Subclasses provide `voronoi`, `pool`, `cost_model`, `cache`, `key`, `nbits`, `symmetries` and `transform`."""
+
+    @property
+    def transition_matrices(self):
+        if not hasattr(self, "_transition_matrices"):
+            assembler = LoopAssembler(self.voronoi.planar_graph, self.integrated_edges)
+            self._transition_matrices = [assembler.loop(Util.simplify_path(path)) for path in self.voronoi.pointed_loops] # simplifying should most likely be done in voronoi instead ?
+        return self._transition_matrices
+
+    def edges_of_loops(self, loops):
+        """Given a list of indices of pointed loops, returns the indices of the edges these loops go through."""
+        indices = []
+        seen = set()
+        for k in loops:
+            path = Util.simplify_path(self.voronoi.pointed_loops[k])
+            for i in range(len(path)-1):
+                index = self.voronoi.planar_graph.edge_index(path[i], path[i+1])
+                if index not in seen:
+                    seen.add(index)
+                    indices += [index]
+        return indices
+
+    def refine(self, loops):
+        """Integrates again with twice the precision the edges along the pointed loops of index in `loops`. 
+        The transition matrices along the other edges are kept."""
+        indices = self.edges_of_loops(loops)
+        logger.info("Refining %d edges along loops %s."% (len(indices), str(loops)))
+        for i in indices:
+            self.edge_precisions[i] *= 2
+        self._integrate_edges(indices)
+        if hasattr(self, "_transition_matrices"):
+            del self._transition_matrices
+
+    @property
+    def edge_precisions(self):
+        """The precision (in bits) with which each edge is integrated."""
+        if not hasattr(self, "_edge_precisions"):
+            self._edge_precisions = [self.nbits]*len(self.voronoi.edges)
+        return self._edge_precisions
+
+    @property
+    def integrated_edges(self):
+        if not hasattr(self, "_integrated_edges"):
+            self._integrated_edges = [None]*len(self.voronoi.edges)
+            self._integrate_edges(self.loop_edges)
+        return self._integrated_edges
+
+    @property
+    def loop_edges(self):
+        """The indices of the edges used by the pointed loops. The other edges of the path structure are never integrated."""
+        if not hasattr(self, "_loop_edges"):
+            self._loop_edges = self.edges_of_loops(range(len(self.voronoi.pointed_loops)))
+            logger.info("[%d] %d of the %d edges are used by the pointed loops."% (os.getpid(), len(self._loop_edges), len(self.voronoi.edges)))
+        return self._loop_edges
+
+    def _integrate_edges(self, indices):
+        """Integrates the edges of index in `indices`, up to symmetry, and stores the results in self._integrated_edges."""
+        representatives, derived = self._edges_to_integrate(indices, self.symmetries)
+        edges = [[self.voronoi.vertices[v] for v in self.voronoi.edges[i]] for i in representatives]
+        try:
+            integrated_edges_temp = self._integrate_segments(edges, [self.edge_precisions[i] for i in representatives])
+        finally:
+            self.pool.close() # the workers are not kept between the integration and the refinements
+        self._store_edges(representatives, integrated_edges_temp, derived)
+
+    def _edges_to_integrate(self, indices, symmetries):
+        """Given the indices of edges to compute, returns the pair (representatives, derived), where `representatives` are the indices of the edges to integrate,
+        and `derived` is a list of tuples (j, k, g, reverse), meaning that the transition matrix along the j-th edge is deduced by the symmetry g 
+        from the one along the edge representatives[k] (and inverted if `reverse` is True)."""
+        graph = self.voronoi.planar_graph
+        def images(i):
+            e = self.voronoi.edges[i]
+            res = []
+            for g, vertex_map in symmetries:
+                h = graph.half_edge(vertex_map[e[0]], vertex_map[e[1]])
+                if h != None:
+                    res += [(h >> 1, g, h & 1 == 1)]
+            return res
+
+        indices = list(indices)
+        queued = set(indices)
+        for i in list(indices): # the images of an edge are derived from it, so they have to be updated as well
+            for j, _, _ in images(i):
+                if j not in queued:
+                    queued.add(j)
+                    indices += [j]
+        representatives, derived = [], []
+        covered = set()
+        for i in indices:
+            if i in covered:
+                continue
+            covered.add(i)
+            representatives += [i]
+            for j, g, reverse in images(i):
+                if j not in covered:
+                    covered.add(j)
+                    derived += [(j, len(representatives)-1, g, reverse)]
+        return representatives, derived
+
+    def _store_edges(self, representatives, integrated_edges_temp, derived):
+        """Stores the transition matrices along the integrated edges, as well as along the edges deduced from them by symmetry."""
+        integrated_edges = self._integrated_edges
+        for i, ntm in zip(representatives, integrated_edges_temp):
+            integrated_edges[i] = ntm
+        for j, k, g, reverse in derived:
+            ntm = self.transform(g, integrated_edges_temp[k])
+            integrated_edges[j] = ntm.inverse() if reverse else ntm
+            self.edge_precisions[j] = self.edge_precisions[representatives[k]]
+
+    def _integrate_segments(self, edges, precisions):
+        """Returns the transition matrices along the segments `edges`, computed with the precisions `precisions`.
+        The segments are given to the workers by decreasing estimated cost, and the most expensive ones are split in pieces integrated in parallel."""
+        result = [None]*len(edges)
+        if self.cache != None:
+            result = [self.cache.get(self.key, e, nbits) for e, nbits in zip(edges, precisions)]
+        remaining = [k for k in range(len(edges)) if result[k] is None]
+        if len(remaining) < len(edges):
+            logger.info("Found %d edges in cache."% (len(edges) - len(remaining)))
+        tasks, npieces = self.cost_model.schedule([edges[k] for k in remaining], [precisions[k] for k in remaining], self.pool.nworkers)
+        N = len(remaining)
+        pieces = [[None]*n for n in npieces]
+        timings = []
+        for (i, path, nbits), res, duration in self.pool.imap([([k,N,j], path, nbits) for k, j, path, nbits in tasks], timed=True):
+            pieces[i[0]][i[2]], cached = self._edge_result(res)
+            if not cached: # a transition matrix found in the cache says nothing about the cost of the integration
+                timings += [(path, nbits, duration)]
+        self.cost_model.record(timings)
+
+        for k, ntms in zip(remaining, pieces):
+            ntm = ntms[0]
+            for M in ntms[1:]:
+                ntm = M * ntm
+            if len(ntms)>1 and self.cache != None:
+                self.cache.put(self.key, edges[k], precisions[k], ntm)
+            result[k] = ntm
+        return result
+
+    def _edge_result(self, res):
+        """The pair (ntm, cached) in the result `res` of a worker, where cached is whether the transition matrix ntm was found in the cache."""
+        return res
+
+    @classmethod
+    def _integrate_with_retries(cls, integrate, i, nbits, maxtries=5):
+        """Returns the pair (ntm, nbits), where ntm = integrate(nbits, bounds_prec) is a transition matrix precise enough to be inverted.
+        On a precision error, nbits and bounds_prec are doubled, at most `maxtries` times."""
+        tries = 1
+        bounds_prec = 256
+        while True:
+            try:
+                ntm = integrate(nbits, bounds_prec)
+                ntmi = ntm**-1 # checking the matrix is precise enough to be inverted
+                return ntm, nbits
+            except (BoundPrecisionError, PrecisionError, ZeroDivisionError) as e:
+                tries+=1
+                if tries<maxtries:
+                    bounds_prec *=2
+                    nbits*=2
+                    logger.info("[%d] Precision error when integrating edge [%d/%d]. Trying again with double bounds_prec (%d) and nbits (%d)."% (os.getpid(), i[0]+1, i[1], bounds_prec, nbits))
+                    continue
+                else:
+                    logger.info("[%d] Too many precision errors when integrating edge [%d/%d]. Stopping computation here"% (os.getpid(), i[0]+1, i[1]))
+                    raise e
+
+
+class Integrator(EdgeIntegrator):
+    def __init__(self, path_structure, operator, nbits, cache=None):
         self._operator = DifferentialOperator(operator)
         self.operator._singularities()
         self.nbits = nbits
         self.voronoi = path_structure
+        self.cache = cache
+        self.key = EdgeCache.operator_key(self.operator) if cache != None else None
 
     @property
     def operator(self):
         return self._operator
-    
 
     @property
-    def transition_matrices(self):
-        if not hasattr(self, "_transition_matrices"):
-            transition_matrices = []
-            for path in self.voronoi.pointed_loops:
-                path = Util.simplify_path(path) # this should most likely be done in voronoi instead ?
-                transition_matrix = 1
-                N = len(path)
-                for i in range(N-1):
-                    e = path[i:i+2]
-                    if e in self.voronoi.edges:
-                        index = self.voronoi.edges.index(e)
-                        transition_matrix = self.integrated_edges[index] * transition_matrix
-                    else:
-                        index = self.voronoi.edges.index([e[1], e[0]])
-                        transition_matrix = self.integrated_edges[index]**-1 * transition_matrix
-                transition_matrices += [transition_matrix]
-            self._transition_matrices = transition_matrices
-        return self._transition_matrices
+    def pool(self):
+        """The pool of workers integrating the operator. The workers are forked for each batch of edges, and keep the operator and its singularities."""
+        if not hasattr(self, "_pool"):
+            self._pool = WorkerPool(Integrator._integrate_edge, self.operator, key=self.key, cache=self.cache)
+        return self._pool
 
-    def find_complex_conjugates(self):
-        complex_conjugates = [None]*len(self.voronoi.vertices)
-        for i in range(len(self.voronoi.vertices)):
-            if complex_conjugates[i]==None:
-                if self.voronoi.vertices[i].conjugate() in self.voronoi.vertices:
-                    complex_conjugates[i] = self.voronoi.vertices.index(self.voronoi.vertices[i].conjugate())
-                    complex_conjugates[complex_conjugates[i]] = i
-        return complex_conjugates
+    @property
+    def cost_model(self):
+        if not hasattr(self, "_cost_model"):
+            directory = self.cache.directory if self.cache != None else None
+            self._cost_model = EdgeCostModel(self.voronoi.points[1:], self.operator.order(), self.operator.degree(), directory)
+        return self._cost_model
 
     @property
-    def integrated_edges(self):
-        if not hasattr(self, "_integrated_edges"):
-            complex_conjugates = self.find_complex_conjugates()
-            index_of_edges_to_integrate = []
-            edges=[]
-            for i, e in enumerate(self.voronoi.edges):
-                if [e[1], e[0]] not in edges and [complex_conjugates[e[0]], complex_conjugates[e[1]]] not in edges and [complex_conjugates[e[1]], complex_conjugates[e[0]]] not in edges:
-                    index_of_edges_to_integrate+=[i]
-                    edges+=[e]
-
-            edges = [[self.voronoi.vertices[e[0]], self.voronoi.vertices[e[1]]] for e in edges]
-            N = len(edges)
-            integration_result = Integrator._integrate_edge([([i,N],self.operator,[e[0], e[1]], self.nbits) for i, e in list(enumerate(edges))])
-            integrated_edges_temp= [None]*N
-
-            for [inp, _], ntm in integration_result:
-                if ntm == 'NO DATA': # why is this not a result of @parallel?
-                    logger.warning("failed to integrate operator")
-                integrated_edges_temp[inp[0][0]] = ntm # there should be a cleaner way to do this
-
-            integrated_edges = [None]*len(self.voronoi.edges)
-            for index, i in enumerate(index_of_edges_to_integrate):
-                integrated_edges[i] = integrated_edges_temp[index]
-                e = self.voronoi.edges[i]
-                if [complex_conjugates[e[0]], complex_conjugates[e[1]]] == e:
-                    continue
-                if [complex_conjugates[e[0]], complex_conjugates[e[1]]] in self.voronoi.edges:
-                    j = self.voronoi.edges.index([complex_conjugates[e[0]], complex_conjugates[e[1]]])
-                    integrated_edges[j] = integrated_edges_temp[index].conjugate()
-                if [complex_conjugates[e[1]], complex_conjugates[e[0]]] in self.voronoi.edges:
-                    j = self.voronoi.edges.index([complex_conjugates[e[1]], complex_conjugates[e[0]]])
-                    integrated_edges[j] = integrated_edges_temp[index].inverse().conjugate()
-
-            self._integrated_edges = integrated_edges
-        return self._integrated_edges
-    
+    def symmetries(self):
+        """The symmetries (among rotations by fourth roots of unity and complex conjugation) leaving the operator invariant, with the maps they induce on the vertices."""
+        if not hasattr(self, "_symmetries"):
+            self._symmetries = [(g, g.vertex_map(self.voronoi.vertices)) for g in Symmetry.group() if g.leaves_operator_invariant(self.operator)]
+            logger.info("Found symmetries %s of the operator."% str([g for g, _ in self._symmetries]))
+        return self._symmetries
+
+    def transform(self, g, M):
+        return g.transform_jets(M)
+
     @classmethod
-    @parallel
-    def _integrate_edge(cls, i, L, l, nbits=300, maxtries=5, verbose=False):
-        """ Returns the numerical transition matrix of L along l, adapted to computations of Voronoi. Accepts l=[]
+    def _integrate_edge(cls, L, i, l, nbits=300, key=None, cache=None, maxtries=5, verbose=False):
+        """ Returns the pair (ntm, cached), where ntm is the numerical transition matrix of L along l, adapted to computations of Voronoi,
+        and cached is whether it was found in the cache. Accepts l=[]
+        If a cache is given, the transition matrix is looked up in the cache first, and stored in it once computed.
+        If the integration fails for lack of precision, it is tried again with twice the precision, at most `maxtries` times.
         """
+        if cache != None and l != []:
+            ntm = cache.get(key, l, nbits)
+            if ntm is not None:
+                logger.info("[%d] Found edge [%d/%d] in cache"% (os.getpid(), i[0]+1,i[1]))
+                return ntm, True
         logger.info("[%d] Starting integration along edge [%d/%d]"% (os.getpid(), i[0]+1,i[1]))
-        tries = 1
-        bounds_prec=256
         begin = time.time()
-        eps = Z(2)**(-Z(nbits))
-        while True:
-            # try:
-            ntm = L.numerical_transition_matrix(l, eps=eps, assume_analytic=True, bounds_prec=bounds_prec) if l!= [] else identity_matrix(L.order()) 
-            ntmi = ntm**-1 # checking the matrix is precise enough to be inverted
-            # except Exception as e: # TODO: manage different types of exceptions
-            #     tries+=1
-            #     if tries<maxtries:
-            #         bounds_prec *=2
-            #         nbits*=2
-            #         logger.info("[%d] Precision error when integrating edge [%d/%d]. Trying again with double bounds_prec (%d) and nbits (%d)."% (os.getpid(), i[0]+1, i[1], bounds_prec, nbits))
-            #         continue
-            #     else:
-            #         logger.info("[%d] Too many ValueErrors when integrating edge [%d/%d]. Stopping computation here"% (os.getpid(), i[0]+1, i[1]))
-            #         raise e
-            break
+        def integrate(nbits, bounds_prec):
+            if l == []:
+                return identity_matrix(L.order())
+            return L.numerical_transition_matrix(l, eps=Z(2)**(-Z(nbits)), assume_analytic=True, bounds_prec=bounds_prec)
+        ntm, nbits = cls._integrate_with_retries(integrate, i, nbits, maxtries)
 
         end = time.time()
         duration = end-begin
         duration_str = time.strftime("%H:%M:%S",time.gmtime(duration))
         logger.info("[%d] Finished integration along edge [%d/%d] in %s"% (os.getpid(), i[0]+1,i[1], duration_str))
 
-        return ntm
\ No newline at end of file
+        if cache != None and l != []:
+            cache.put(key, l, nbits, ntm)
+        return ntm, False
\ No newline at end of file
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+
+# lefschetz-family
+# Copyright (C) 2021  Eric Pichon-Pharabod
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import sage.all
+
+from ore_algebra import *
+
+from sage.rings.complex_double import CDF
+from sage.rings.rational_field import QQ
+from sage.functions.other import floor
+
+from .integrator import Integrator
+from .edgeCache import EdgeCache
+from .workerPool import WorkerPool
+from .costModel import EdgeCostModel
+
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class IntegratorBatch(object):
+    def __init__(self, path_structure, operators, nbits, cache=None):
+        """IntegratorBatch(path_structure, operators, nbits, cache=None)
+
+        Computes the transition matrices of several differential operators along the same paths, in a single pass over the edges.
+        Each worker integrates all the operators along an edge, following a subdivision of the edge adapted to the union of their singular points.
+        """
+        self.integrators = [Integrator(path_structure, L, nbits, cache=cache) for L in operators]
+        self.nbits = nbits
+        self.voronoi = path_structure
+        self.cache = cache
+
+    @property
+    def operators(self):
+        return [integrator.operator for integrator in self.integrators]
+
+    @property
+    def singularities(self):
+        """The union of the singular points of the operators, as complex numbers."""
+        if not hasattr(self, "_singularities"):
+            singularities = []
+            for L in self.operators:
+                for s in L._singularities():
+                    s = complex(CDF(s))
+                    if s not in singularities:
+                        singularities += [s]
+            self._singularities = singularities
+        return self._singularities
+
+    @property
+    def pool(self):
+        if not hasattr(self, "_pool"):
+            keys = [integrator.key for integrator in self.integrators]
+            self._pool = WorkerPool(IntegratorBatch._integrate_edge, self.operators, self.singularities, keys=keys, cache=self.cache)
+        return self._pool
+
+    @property
+    def cost_model(self):
+        if not hasattr(self, "_cost_model"):
+            directory = self.cache.directory if self.cache != None else None
+            order = sum([L.order() for L in self.operators])
+            degree = max([L.degree() for L in self.operators])
+            self._cost_model = EdgeCostModel(self.voronoi.points[1:], order, degree, directory)
+        return self._cost_model
+
+    @property
+    def edge_precisions(self):
+        return self.integrators[0].edge_precisions
+
+    @property
+    def transition_matrices(self):
+        """The list of the transition matrices of each operator along the pointed loops."""
+        self.integrated_edges
+        return [integrator.transition_matrices for integrator in self.integrators]
+
+    @property
+    def integrated_edges(self):
+        if not hasattr(self, "_integrated_edges"):
+            for integrator in self.integrators:
+                integrator._integrated_edges = [None]*len(self.voronoi.edges)
+            self._integrate_edges(self.integrators[0].loop_edges)
+            self._integrated_edges = [integrator._integrated_edges for integrator in self.integrators]
+        return self._integrated_edges
+
+    def refine(self, loops):
+        """Integrates again with twice the precision the edges along the pointed loops of index in `loops`, for all operators."""
+        indices = self.integrators[0].edges_of_loops(loops)
+        logger.info("Refining %d edges along loops %s."% (len(indices), str(loops)))
+        for integrator in self.integrators:
+            for i in indices:
+                integrator.edge_precisions[i] *= 2
+            if hasattr(integrator, "_transition_matrices"):
+                del integrator._transition_matrices
+        self._integrate_edges(indices)
+
+    @property
+    def symmetries(self):
+        """The symmetries leaving all the operators invariant."""
+        if not hasattr(self, "_symmetries"):
+            self._symmetries = [(g, vertex_map) for g, vertex_map in self.integrators[0].symmetries if all([g in [h for h, _ in integrator.symmetries] for integrator in self.integrators])]
+        return self._symmetries
+
+    def _integrate_edges(self, indices):
+        representatives, derived = self.integrators[0]._edges_to_integrate(indices, self.symmetries)
+        edges = [[self.voronoi.vertices[v] for v in self.voronoi.edges[i]] for i in representatives]
+        try:
+            integrated_edges_temp = self._integrate_segments(edges, [self.edge_precisions[i] for i in representatives])
+        finally:
+            self.pool.close() # the workers are not kept between the integration and the refinements
+        for m, integrator in enumerate(self.integrators):
+            integrator._store_edges(representatives, [ntms[m] for ntms in integrated_edges_temp], derived)
+
+    def _integrate_segments(self, edges, precisions):
+        """Returns, for each segment of `edges`, the list of the transition matrices of the operators along it."""
+        result = [None]*len(edges)
+        if self.cache != None:
+            for k, (e, nbits) in enumerate(zip(edges, precisions)):
+                ntms = [self.cache.get(integrator.key, e, nbits) for integrator in self.integrators]
+                result[k] = ntms if all([ntm is not None for ntm in ntms]) else None
+        remaining = [k for k in range(len(edges)) if result[k] is None]
+        if len(remaining) < len(edges):
+            logger.info("Found %d edges in cache."% (len(edges) - len(remaining)))
+        tasks, npieces = self.cost_model.schedule([edges[k] for k in remaining], [precisions[k] for k in remaining], self.pool.nworkers)
+        N = len(remaining)
+        pieces = [[None]*n for n in npieces]
+        timings = []
+        for (i, path, nbits), (ntms, cached), duration in self.pool.imap([([k,N,j], path, nbits) for k, j, path, nbits in tasks], timed=True):
+            pieces[i[0]][i[2]] = ntms
+            if not cached: # transition matrices found in the cache say nothing about the cost of the integration
+                timings += [(path, nbits, duration)]
+        self.cost_model.record(timings)
+
+        for k, ntmss in zip(remaining, pieces):
+            ntms = ntmss[0]
+            for Ms in ntmss[1:]:
+                ntms = [M * ntm for M, ntm in zip(Ms, ntms)]
+            if len(ntmss)>1 and self.cache != None:
+                for integrator, ntm in zip(self.integrators, ntms):
+                    self.cache.put(integrator.key, edges[k], precisions[k], ntm)
+            result[k] = ntms
+        return result
+
+    @classmethod
+    def subdivide(cls, l, singularities, ratio=QQ(1)/2, bits=20):
+        """Subdivides the segment l so that each step is shorter than `ratio` times the distance from its start to the closest singularity.
+        The intermediate points are exact, at parameters with denominators dividing 2**bits."""
+        a, b = complex(CDF(l[0])), complex(CDF(l[1]))
+        length = abs(b-a)
+        if length == 0 or len(singularities) == 0:
+            return l
+        ts = [QQ(0)]
+        while True:
+            z = a + (b-a)*float(ts[-1])
+            dt = ratio*min([abs(z-s) for s in singularities])/length
+            if ts[-1] + dt >= 1:
+                break
+            t = floor((ts[-1] + dt)*2**bits)/QQ(2**bits)
+            ts += [max(t, ts[-1] + QQ(1)/2**bits)]
+        return [l[0]] + [l[0] + (l[1]-l[0])*t for t in ts[1:]] + [l[1]]
+
+    @classmethod
+    def _integrate_edge(cls, Ls, singularities, i, l, nbits=300, keys=None, cache=None):
+        """Returns the pair (ntms, cached), where ntms is the list of the numerical transition matrices of the operators Ls along l, all following the same subdivision of l,
+        and cached is whether they were all found in the cache. The matrices are looked up in and stored in the cache along the segment l."""
+        path = cls.subdivide(l, singularities)
+        logger.info("[%d] Starting integration of %d operators along edge [%d/%d] (%d steps)"% (os.getpid(), len(Ls), i[0]+1,i[1], len(path)-1))
+        begin = time.time()
+        ntms = []
+        cached = True
+        for L, key in zip(Ls, keys):
+            ntm = cache.get(key, l, nbits) if cache != None else None
+            if ntm is None:
+                ntm, _ = Integrator._integrate_edge(L, i, path, nbits)
+                cached = False
+                if cache != None:
+                    cache.put(key, l, nbits, ntm)
+            ntms += [ntm]
+        end = time.time()
+        duration_str = time.strftime("%H:%M:%S",time.gmtime(end-begin))
+        logger.info("[%d] Finished integration of %d operators along edge [%d/%d] in %s"% (os.getpid(), len(Ls), i[0]+1,i[1], duration_str))
+        return ntms, cached
@@ -21,15 +21,18 @@ import sage.all
 from ore_algebra import *
 
 from sage.matrix.special import identity_matrix
-from sage.parallel.decorate import parallel
 from ore_algebra.analytic.differential_operator import DifferentialOperator
 from ore_algebra.analytic.context import Context
 
 from sage.rings.integer_ring import Z
 
-from .simul_integrator_function import fundamental_matrices
+from .simul_integrator_function import fundamental_matrices, PreparedSystem, StepController
 
-from .util import Util
+from .integrator import EdgeIntegrator
+from .edgeCache import EdgeCache
+from .workerPool import WorkerPool
+from .costModel import EdgeCostModel
+from .symmetry import Symmetry
 
 import logging
 import os
@@ -38,12 +41,14 @@ import time
 logger = logging.getLogger(__name__)
 
 
-class IntegratorSimultaneous(object):
-    def __init__(self, path_structure, rat_coefs, gaussmanin, nbits):
+class IntegratorSimultaneous(EdgeIntegrator):
+    def __init__(self, path_structure, rat_coefs, gaussmanin, nbits, cache=None):
         self._rat_coefs = rat_coefs
         self._gaussmanin = gaussmanin
         self.nbits = nbits
         self.voronoi = path_structure
+        self.cache = cache
+        self.key = EdgeCache.system_key(*gaussmanin, *rat_coefs) if cache != None else None
 
     @property
     def gaussmanin(self):
@@ -52,93 +57,93 @@ class IntegratorSimultaneous(object):
     @property
     def rat_coefs(self):
         return self._rat_coefs
-    
 
     @property
-    def transition_matrices(self):
-        if not hasattr(self, "_transition_matrices"):
-            transition_matrices = []
-            for path in self.voronoi.pointed_loops:
-                path = Util.simplify_path(path) # this should most likely be done in voronoi instead ?
-                transition_matrix = 1
-                N = len(path)
-                for i in range(N-1):    
-                    e = path[i:i+2]
-                    if e in self.voronoi.edges:
-                        index = self.voronoi.edges.index(e)
-                        transition_matrix = self.integrated_edges[index] * transition_matrix
-                    else:
-                        index = self.voronoi.edges.index([e[1], e[0]])
-                        transition_matrix = self.integrated_edges[index]**-1 * transition_matrix
-                transition_matrices += [transition_matrix]
-            self._transition_matrices = transition_matrices
-        return self._transition_matrices
-
-    def find_complex_conjugates(self):
-        complex_conjugates = [None]*len(self.voronoi.vertices)
-        for i in range(len(self.voronoi.vertices)):
-            if complex_conjugates[i]==None:
-                if self.voronoi.vertices[i].conjugate() in self.voronoi.vertices:
-                    complex_conjugates[i] = self.voronoi.vertices.index(self.voronoi.vertices[i].conjugate())
-                    complex_conjugates[complex_conjugates[i]] = i
-        return complex_conjugates
+    def prepared_system(self):
+        """The uncoupled system, computed once and shared by the integrations along all edges."""
+        if not hasattr(self, "_prepared_system"):
+            A, denA = self.gaussmanin
+            R, denR = self.rat_coefs
+            begin = time.time()
+            filename = os.path.join(self.cache.directory, "steps_%s.json"% self.key) if self.cache != None else None
+            self._prepared_system = PreparedSystem(A, denA, R, denR, step_controller=StepController(filename))
+            duration_str = time.strftime("%H:%M:%S",time.gmtime(time.time()-begin))
+            logger.info("[%d] Uncoupled system prepared in %s."% (os.getpid(), duration_str))
+        return self._prepared_system
 
     @property
-    def integrated_edges(self):
-        if not hasattr(self, "_integrated_edges"):
-            complex_conjugates = self.find_complex_conjugates()
-            index_of_edges_to_integrate = []
-            edges=[]
-            for i, e in enumerate(self.voronoi.edges):
-                if [e[1], e[0]] not in edges and [complex_conjugates[e[0]], complex_conjugates[e[1]]] not in edges and [complex_conjugates[e[1]], complex_conjugates[e[0]]] not in edges:
-                    index_of_edges_to_integrate+=[i]
-                    edges+=[e]
-
-            edges = [[self.voronoi.vertices[e[0]], self.voronoi.vertices[e[1]]] for e in edges]
-            N = len(edges)
-            A, denA = self._gaussmanin
-            R, denR = self._rat_coefs
-            integration_result = IntegratorSimultaneous._integrate_edge([([i,N],A, denA, R, denR,[e[0], e[1]], self.nbits) for i, e in list(enumerate(edges))])
-            integrated_edges_temp= [None]*N
-
-            for [inp, _], ntm in integration_result:
-                if ntm == 'NO DATA': # why is this not a result of @parallel?
-                    logger.warning("failed to integrate operator")
-                integrated_edges_temp[inp[0][0]] = ntm # there should be a cleaner way to do this
-
-            integrated_edges = [None]*len(self.voronoi.edges)
-            for index, i in enumerate(index_of_edges_to_integrate):
-                integrated_edges[i] = integrated_edges_temp[index]
-                e = self.voronoi.edges[i]
-                if [complex_conjugates[e[0]], complex_conjugates[e[1]]] == e:
-                    continue
-                if [complex_conjugates[e[0]], complex_conjugates[e[1]]] in self.voronoi.edges:
-                    j = self.voronoi.edges.index([complex_conjugates[e[0]], complex_conjugates[e[1]]])
-                    integrated_edges[j] = integrated_edges_temp[index].conjugate()
-                if [complex_conjugates[e[1]], complex_conjugates[e[0]]] in self.voronoi.edges:
-                    j = self.voronoi.edges.index([complex_conjugates[e[1]], complex_conjugates[e[0]]])
-                    integrated_edges[j] = integrated_edges_temp[index].inverse().conjugate()
-
-            self._integrated_edges = integrated_edges
-        return self._integrated_edges
+    def pool(self):
+        """The pool of workers integrating the system. The workers are forked for each batch of edges, and keep the prepared system and the integrands."""
+        if not hasattr(self, "_pool"):
+            A, denA = self.gaussmanin
+            R, denR = self.rat_coefs
+            self._pool = WorkerPool(IntegratorSimultaneous._integrate_edge, A, denA, R, denR, key=self.key, cache=self.cache, prepared=self.prepared_system)
+        return self._pool
     
+
+    @property
+    def cost_model(self):
+        if not hasattr(self, "_cost_model"):
+            A, denA = self.gaussmanin
+            R, denR = self.rat_coefs
+            directory = self.cache.directory if self.cache != None else None
+            self._cost_model = EdgeCostModel(self.voronoi.points[1:], A.nrows() + R.nrows(), denA.degree(), directory)
+        return self._cost_model
+
+    @property
+    def symmetries(self):
+        """The symmetries (among rotations by fourth roots of unity and complex conjugation) leaving the system and the integrands invariant, with the maps they induce on the vertices."""
+        if not hasattr(self, "_symmetries"):
+            self._symmetries = [(g, g.vertex_map(self.voronoi.vertices)) for g in Symmetry.group() if g.leaves_system_invariant(*self.gaussmanin) and g.leaves_system_invariant(*self.rat_coefs)]
+            logger.info("Found symmetries %s of the system."% str([g for g, _ in self._symmetries]))
+        return self._symmetries
+
+    def transform(self, g, M):
+        return g.transform_values(M)
+
+    def _edge_result(self, res):
+        ntm, ratio, cached = res
+        if ratio is not None:
+            self._step_ratios += [ratio]
+        return ntm, cached
+
+    def _integrate_segments(self, edges, precisions):
+        """Same as EdgeIntegrator._integrate_segments. The step ratios learned by the workers are then merged and saved once."""
+        self._step_ratios = []
+        result = super()._integrate_segments(edges, precisions)
+        if len(self._step_ratios) > 0:
+            controller = self.prepared_system.step_controller
+            controller.merge(self._step_ratios)
+            controller.save()
+        return result
+
     @classmethod
-    @parallel
-    def _integrate_edge(cls, i, A, denA, R, denR, l, nbits=300):
-        """ Returns the numerical transition matrix of L along l, adapted to computations of Voronoi. Accepts l=[]
+    def _integrate_edge(cls, A, denA, R, denR, i, l, nbits=300, key=None, cache=None, maxtries=5, prepared=None):
+        """ Returns the triple (ntm, ratio, cached), where ntm is the numerical transition matrix of the system along l, adapted to computations of Voronoi,
+        ratio is the step ratio learned by the step controller of this worker (None if nothing was integrated), and cached is whether ntm was found in the cache. Accepts l=[]
+        If a cache is given, the transition matrix is looked up in the cache first, and stored in it once computed.
+        If the integration fails for lack of precision, it is tried again with twice the precision, at most `maxtries` times.
         """
+        if cache != None and l != []:
+            ntm = cache.get(key, l, nbits)
+            if ntm is not None:
+                logger.info("[%d] Found edge [%d/%d] in cache"% (os.getpid(), i[0]+1,i[1]))
+                return ntm, None, True
         logger.info("[%d] Starting integration along edge [%d/%d]"% (os.getpid(), i[0]+1,i[1]))
-        tries = 1
-        bounds_prec=256
         begin = time.time()
-        eps = Z(2)**(-Z(nbits))
         ctx = Context(assume_analytic=True)
-        ntm = fundamental_matrices(A, denA, R, denR, l, eps, ctx=ctx) if l!= [] else identity_matrix(A.nrows() + R.nrows()) 
-        ntmi = ntm**-1 
+        def integrate(nbits, bounds_prec):
+            if l == []:
+                return identity_matrix(A.nrows() + R.nrows())
+            return fundamental_matrices(A, denA, R, denR, l, Z(2)**(-Z(nbits)), ctx=ctx, prepared=prepared, bounds_prec=bounds_prec)
+        ntm, nbits = cls._integrate_with_retries(integrate, i, nbits, maxtries)
 
         end = time.time()
         duration = end-begin
         duration_str = time.strftime("%H:%M:%S",time.gmtime(duration))
         logger.info("[%d] Finished integration along edge [%d/%d] in %s"% (os.getpid(), i[0]+1,i[1], duration_str))
 
-        return ntm
\ No newline at end of file
+        if cache != None and l != []:
+            cache.put(key, l, nbits, ntm)
+        ratio = prepared.step_controller.ratio if l != [] and prepared != None and prepared.step_controller != None else None
+        return ntm, ratio, False
\ No newline at end of file
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+# lefschetz-family
+# Copyright (C) 2021  Eric Pichon-Pharabod
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import sage.all
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LoopAssembler(object):
+    def __init__(self, graph, integrated_edges):
+        """LoopAssembler(graph, integrated_edges)
+
+        Computes transition matrices along paths in a PlanarGraph `graph`, given the transition matrices `integrated_edges` along its edges.
+        Each edge matrix is inverted at most once, and the products along the common prefixes of pointed loops are shared:
+        a pointed loop p + c + reversed(p) is computed as P^-1 * C * P, where P is the cached product along p.
+        """
+        self._graph = graph
+        self._integrated_edges = integrated_edges
+        self._inverses = {}
+        self._prefixes = {(): (1, 1)}
+
+    def edge(self, a, b):
+        """The transition matrix along the edge from a to b."""
+        h = self._graph.half_edge(a, b)
+        if h & 1 == 0:
+            return self._integrated_edges[h >> 1]
+        return self.inverse(h >> 1)
+
+    def edge_inverse(self, a, b):
+        """The inverse of the transition matrix along the edge from a to b."""
+        h = self._graph.half_edge(a, b)
+        if h & 1 == 1:
+            return self._integrated_edges[h >> 1]
+        return self.inverse(h >> 1)
+
+    def inverse(self, i):
+        if i not in self._inverses:
+            self._inverses[i] = self._integrated_edges[i]**-1
+        return self._inverses[i]
+
+    def prefix(self, path):
+        """Returns the pair (P, P^-1), where P is the transition matrix along `path`, given as a tuple of vertices."""
+        if len(path) == 1:
+            return self._prefixes[()]
+        if path not in self._prefixes:
+            P, Pinv = self.prefix(path[:-1])
+            a, b = path[-2], path[-1]
+            self._prefixes[path] = (self.edge(a, b) * P, Pinv * self.edge_inverse(a, b))
+        return self._prefixes[path]
+
+    def path(self, path):
+        """The transition matrix along `path`, without caching."""
+        M = 1
+        for a, b in zip(path[:-1], path[1:]):
+            M = self.edge(a, b) * M
+        return M
+
+    def loop(self, path):
+        """The transition matrix along the pointed loop `path`."""
+        k = 0
+        while k < len(path)//2 and path[k+1] == path[-k-2]:
+            k += 1
+        P, Pinv = self.prefix(tuple(path[:k+1]))
+        return Pinv * self.path(path[k:len(path)-k]) * P
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+
+# lefschetz-family
+# Copyright (C) 2021  Eric Pichon-Pharabod
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import sage.all
+
+from sage.rings.complex_mpfr import ComplexField
+from sage.rings.imaginary_unit import I
+
+import logging
+
+from .util import Util
+from .voronoi import FundamentalGroupVoronoi
+from .triangulation import DelaunayTriangulation
+from .planarGraph import PlanarGraph
+
+logger = logging.getLogger(__name__)
+
+
+class FundamentalGroupMultiscale(object):
+    # a cluster is tight if its radius is this many times smaller than its distance to the other points
+    separation = 20
+
+    def __init__(self, points, basepoint):
+        """FundamentalGroupMultiscale(points, basepoint)
+
+        Paths for points forming tight clusters, where the Voronoi graph of all the points would have very short edges inside
+        the clusters and long edges passing close to them.
+        Each tight cluster is replaced by its barycenter in a Voronoi graph of the remaining points (with an adaptive border).
+        The loop around the barycenter is then replaced by the loops of a Voronoi graph of the cluster, built at the scale
+        of the cluster and recursively, whose basepoint is connected to the loop around the barycenter.
+        """
+        assert basepoint not in points
+
+        self._points = [basepoint] + points
+        self.CC = ComplexField(500)
+
+    @property
+    def points(self):
+        return self._points
+
+    @property
+    def clusters(self):
+        """The tight clusters, as lists of indices of critical points (at least two per cluster)."""
+        if not hasattr(self, "_clusters"):
+            coordinates = [complex(self.CC(p)) for p in self.points]
+            triangulation = DelaunayTriangulation([(z.real, z.imag) for z in coordinates])
+            edges = sorted(triangulation.edges(), key=lambda e: abs(coordinates[e[0]]-coordinates[e[1]]))
+
+            # single linkage clustering: when a component is first merged, the edge merging it realises its distance to the other points
+            component = list(range(len(self.points)))
+            members = [[i] for i in range(len(self.points))]
+            tight = []
+            def find(i):
+                while component[i] != i:
+                    component[i] = component[component[i]]
+                    i = component[i]
+                return i
+            for a, b in edges:
+                ca, cb = find(a), find(b)
+                if ca == cb:
+                    continue
+                distance = abs(coordinates[a]-coordinates[b])
+                for c in [ca, cb]:
+                    if len(members[c]) > 1 and 0 not in members[c] and self._radius([coordinates[i] for i in members[c]])*self.separation <= distance:
+                        tight += [members[c]]
+                component[cb] = ca
+                members[ca] = members[ca] + members[cb]
+            # we only keep the largest clusters, the smaller ones are dealt with recursively
+            tight.sort(key=len, reverse=True)
+            clusters = []
+            covered = set()
+            for cluster in tight:
+                if not covered.intersection(cluster):
+                    clusters += [sorted(cluster)]
+                    covered.update(cluster)
+            self._clusters = [[i-1 for i in cluster] for cluster in clusters]
+        return self._clusters
+
+    @classmethod
+    def _radius(cls, zs):
+        center = sum(zs)/len(zs)
+        return max([abs(z-center) for z in zs])
+
+    def _build(self):
+        critical = self.points[1:]
+        clustered = set([i for cluster in self.clusters for i in cluster])
+        singles = [i for i in range(len(critical)) if i not in clustered]
+        logger.info("Building multiscale paths with %d clusters and %d isolated points."% (len(self.clusters), len(singles)))
+
+        # the coarse level: isolated points and barycenters of the clusters
+        centers = []
+        for cluster in self.clusters:
+            zs = [self.CC(critical[i]) for i in cluster]
+            centers += [sum(zs)/len(zs)]
+        macro_points = [critical[i] for i in singles] + centers
+        macro_members = [[i] for i in singles] + self.clusters
+        coarse = FundamentalGroupVoronoi(macro_points, self.points[0], border=None)
+        coarse_order = coarse.sort_loops()
+        macro_members = [macro_members[i] for i in coarse_order]
+
+        vertices = list(coarse.vertices)
+        pointed_loops, paths, order = [], [], []
+        for k, members in enumerate(macro_members):
+            if len(members) == 1:
+                pointed_loops += [coarse.pointed_loops[k]]
+                paths += [coarse.paths[k]]
+                order += members
+                continue
+            # the local level: the basepoint of the cluster is between the barycenter and the loop point of its cell
+            center = self.CC(coarse.points[k+1])
+            loop_point = self.CC(vertices[coarse.paths[k][-1]])
+            radius = self._radius([complex(self.CC(critical[i])) for i in members])
+            local_basepoint = center + 2*radius*(loop_point-center)/abs(loop_point-center)
+            local_basepoint = Util.simple_rational(local_basepoint.real(), radius/100) + I*Util.simple_rational(local_basepoint.imag(), radius/100)
+            local = FundamentalGroupMultiscale([critical[i] for i in members], local_basepoint)
+            local_order = local.sort_loops()
+
+            # the local vertices are appended, their basepoint last
+            correspondance = [len(vertices) + j - 1 for j in range(len(local.vertices))]
+            correspondance[0] = len(vertices) - 1 + len(local.vertices)
+            vertices += local.vertices[1:] + local.vertices[:1]
+            for loop, path in zip(local.pointed_loops, local.paths):
+                pointed_loops += [coarse.paths[k] + [correspondance[v] for v in loop] + list(reversed(coarse.paths[k]))]
+                paths += [coarse.paths[k] + [correspondance[v] for v in path]]
+            order += [members[i] for i in local_order]
+
+        edges = []
+        seen = set()
+        for loop in pointed_loops:
+            for e in zip(loop[:-1], loop[1:]):
+                if e[0] != e[1] and e not in seen:
+                    seen.update([e, (e[1], e[0])])
+                    edges += [list(e)]
+        edges.sort(reverse=True, key=lambda e:(vertices[e[0]].real()-vertices[e[1]].real())**2 + (vertices[e[0]].imag()-vertices[e[1]].imag())**2)
+
+        # the loops are computed in the sorted order, we store them in the order of the points
+        position = {i:k for k, i in enumerate(order)}
+        self._vertices = vertices
+        self._edges = edges
+        self._pointed_loops = [pointed_loops[position[i]] for i in range(len(critical))]
+        self._paths = [paths[position[i]] for i in range(len(critical))]
+        self._order = order
+
+    @property
+    def vertices(self):
+        if not hasattr(self, "_vertices"):
+            self._build()
+        return self._vertices
+
+    @property
+    def edges(self):
+        """ returns the edges of the graph given as pairs of indices of self.vertices, in decreasing length
+        """
+        if not hasattr(self, "_edges"):
+            self._build()
+        return self._edges
+
+    @property
+    def planar_graph(self):
+        if not hasattr(self, "_planar_graph"):
+            self._planar_graph = PlanarGraph(self.edges, self.vertices)
+        return self._planar_graph
+
+    @property
+    def pointed_loops(self):
+        if not hasattr(self, "_pointed_loops"):
+            self._build()
+        return self._pointed_loops
+
+    @property
+    def paths(self):
+        if not hasattr(self, "_paths"):
+            self._build()
+        return self._paths
+
+    def sort_loops(self):
+        """Orders the critical points so that the product of their loops is the loop around all of them."""
+        self.pointed_loops
+        order = self._order
+        self._points = [self.points[0]] + [self.points[i+1] for i in order]
+        self._pointed_loops = [self.pointed_loops[i] for i in order]
+        self._paths = [self.paths[i] for i in order]
+        self._order = list(range(len(order)))
+        return order
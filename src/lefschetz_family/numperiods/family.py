@@ -70,6 +70,7 @@ class Family(object):
 
         if basepoint is None:
             basepoint = self._path[-1]
+        self.basepoint = basepoint
 
         self.coho1 = self.cohomologyAt(basepoint)
 
@@ -82,12 +83,26 @@ class Family(object):
         self.dopring = OreAlgebra(self.upolring, 'D' + str(self.upolring.gen()))
 
 
-    @cached_method
     def cohomologyAt(self, t):
+        """The cohomology at t. Only the one at the basepoint is kept: the other points are
+        evaluation points of the reconstructions, which are each used once.
+
+        """
+        if hasattr(self, "coho1") and t == self.basepoint:
+            return self.coho1
         return cohomology.Cohomology(self.pol(self.pol.base_ring()(t))/self.denom(self.pol.base_ring()(t)), shift=self.shift)
 
+    def _reduced_basis_inverse(self, co, pt):
+        """The inverse of the matrix of the coordinates of self.basis in the cohomology co at pt.
+        The one at the basepoint, where _coordinates is called repeatedly, is kept."""
+        if pt != self.basepoint:
+            return Matrix([co.coordinates(b) for b in self.basis]).inverse()
+        if not hasattr(self, "_reduced_basis_at_basepoint"):
+            self._reduced_basis_at_basepoint = Matrix([co.coordinates(b) for b in self.basis]).inverse()
+        return self._reduced_basis_at_basepoint
+
     def modulo(self, prime):
-        return Family(FiniteField(prime).one() * self.pol, denom=FiniteField(prime).one()*self.denom, shift=self.shift)
+        return Family(FiniteField(prime).one() * self.pol, denom=FiniteField(prime).one()*self.denom, basepoint=self.basepoint, shift=self.shift)
 
     def _gaussmanin(self, pt):
         logger.debug("Evaluating cohomology at a point %s" % str(pt))
@@ -98,10 +113,9 @@ class Family(object):
 
         der = (self.pol.derivative()(pt)*self.denom(pt) - self.denom.derivative()(pt)*self.pol(pt))/self.denom(pt)**2
         redmul = Matrix([co.coordinates(-b*der) for b in self.basis])
-        redb = Matrix([co.coordinates(b) for b in self.basis])
 
         # Matrices are row-based.
-        return redmul*redb.inverse()
+        return redmul*self._reduced_basis_inverse(co, pt)
 
     @cached_method
     def gaussmanin(self):
@@ -118,8 +132,50 @@ class Family(object):
         
 
         logger.info("Computing Gauss-Manin connection")
-        fr = interpolation.FunctionReconstruction(self.upolring, self._gaussmanin)
-        return fr.recons(denomapart=True)
+        return self._reconstruct()
+
+    def _reconstruct(self, ws=None):
+        """Return the pair (mat, denom) of the Gauss-Manin connection, or of the
+        coordinates of ws if given, as in FunctionReconstruction.recons(denomapart=True).
+
+        In characteristic zero, the pair is reconstructed modulo several word-size
+        primes in parallel, with the degree bounds found modulo the first one, and
+        lifted to QQ by CRT and rational reconstruction.
+
+        """
+        if self.base_field.characteristic() != 0:
+            evaluator = self._gaussmanin if ws is None else lambda pt: self._coordinates(ws, pt)
+            fr = interpolation.FunctionReconstruction(self.upolring, evaluator)
+            return fr.recons(denomapart=True)
+
+        while True:
+            prime = random_prime(2**30, lbound=2**25)
+            try:
+                mat, denom = self._reconstruct_modulo(prime, ws)
+                break
+            except ZeroDivisionError:
+                logger.info("Bad prime %d, skipping it." % prime)
+        degrees = max([0] + [c.degree() for c in mat.list()]), denom.degree()
+
+        mr = interpolation.ModularReconstruction(lambda p: self._reconstruct_modulo(p, ws, degrees),
+                                                 parallel=True, evaluations={prime: (mat, denom)})
+        mat, denom = mr.recons()
+        return mat.change_ring(self.upolring), self.upolring(denom)
+
+    def _reconstruct_modulo(self, prime, ws=None, degrees=None):
+        """Same as self._reconstruct, over GF(prime). Raise ZeroDivisionError if the prime is bad."""
+        try:
+            modp = self.modulo(prime)
+        except cohomology.NotSmoothError:
+            raise ZeroDivisionError
+        modp.basis = [modp.pol.base_ring()(b) for b in self.basis]
+        if ws is None:
+            evaluator = modp._gaussmanin
+        else:
+            wsp = [modp.pol.parent()(w) for w in ws]
+            evaluator = lambda pt: modp._coordinates(wsp, pt)
+        fr = interpolation.FunctionReconstruction(modp.upolring, evaluator)
+        return fr.recons(denomapart=True, degrees=degrees)
 
 	
     def _coordinates(self, ws, pt):
@@ -129,10 +185,9 @@ class Family(object):
         except cohomology.NotSmoothError:
             raise ZeroDivisionError  # FunctionReconstruction only handles this exception
 
-        redb = Matrix([co.coordinates(b) for b in self.basis])
         coords = Matrix([co.coordinates(w(pt)) for w in ws])
 
-        return coords*redb.inverse()
+        return coords*self._reduced_basis_inverse(co, pt)
 
     def coordinates(self, ws):
         """Returns a list of vectors of coordinates in the basis self.basis, for w in ws
@@ -141,8 +196,7 @@ class Family(object):
         
 
         logger.info("Computing coordinates")
-        fr = interpolation.FunctionReconstruction(self.upolring, lambda pt: self._coordinates(ws, pt))
-        return fr.recons(denomapart=True)
+        return self._reconstruct(ws)
     
     @cached_method
     def picard_fuchs_equation(self, vec=None, form=None):
@@ -1,7 +1,7 @@
 # AUTHORS:
 #   - Pierre Lairez (2019): initial implementation
 
-from sage.arith.misc import random_prime
+from sage.arith.misc import random_prime, inverse_mod, rational_reconstruction
 from sage.functions.other import floor
 from sage.misc.cachefunc import cached_method
 from sage.rings.finite_rings.finite_field_constructor import FiniteField
@@ -16,6 +16,10 @@ from sage.rings.polynomial.polynomial_ring_constructor import PolynomialRing
 from ore_algebra.ore_algebra import DifferentialOperators
 from ore_algebra import ore_operator
 
+from ..workerPool import WorkerPool
+
+from array import array
+
 import logging
 
 def subproduct_tree(self, points):
@@ -162,95 +166,150 @@ PolynomialRing_field.rational_interpolation = rational_interpolation
 
 class Serial:
     def __init__(self, polring=None):
+        """Flattens nested lists, tuples, dicts, matrices, vectors, polynomials, rational functions and operators into a flat
+        list of coefficients and a structure descriptor, and back.
+        The descriptor is a small nested tuple, shared by all the evaluations of the same shape: the entries of a matrix,
+        a vector or a list of polynomials are padded to the same length, so that the descriptor does not depend on their degrees.
+        The data is in the order of the descriptor, so that it is rebuilt by slicing."""
         self.polring = polring
         if not polring is None:
             self.dopring = DifferentialOperators(polring.base_ring(), var=polring.variable_name())
 
         self.polrings = {}
+        self.structs = {}
 
-    def _explode(self, elt, data, struct):
+    def _kind(self, elt):
         if isinstance(elt, list):
-            struct.append("list")
-            struct.append(len(elt))
-            for e in elt:
-                self._explode(e, data, struct)
+            return "list"
         elif isinstance(elt, tuple):
-            struct.append("tuple")
-            self._explode(list(elt), data, struct)
+            return "tuple"
         elif isinstance(elt, dict):
-            struct.append("dict")
-            struct.append(tuple(elt.keys()))
-            self._explode(list(elt.values()), data, struct)
+            return "dict"
         elif isinstance(elt, sage.structure.element.Matrix):
-            struct.append("matrix")
-            self._explode(elt.rows(), data, struct)
+            return "matrix"
         elif isinstance(elt, sage.structure.element.Vector):
-            struct.append("vector")
-            self._explode(elt.list(), data, struct)
+            return "vector"
         elif isinstance(elt, sage.rings.polynomial.polynomial_element.Polynomial):
-            struct.append("polynomial")
-            struct.append(elt.parent().variable_name())
-            self._explode(elt.list(), data, struct)
+            return "polynomial"
         elif isinstance(elt, sage.rings.fraction_field_element.FractionFieldElement_1poly_field):
-            struct.append("ratfun")
-            self._explode(elt.numerator(), data, struct)
-            self._explode(elt.denominator(), data, struct)
+            return "ratfun"
         elif isinstance(elt, ore_operator.UnivariateOreOperator):
-            struct.append("dop")
-            struct.append(elt.parent().base_ring().variable_name())
-            self._explode(elt.list(), data, struct)
+            return "dop"
+        else:
+            return "self"
+
+    def _explode_all(self, elts, data):
+        """Explodes a sequence of elements and returns the descriptor of the sequence (its length is given by the caller)."""
+        kinds = set(self._kind(e) for e in elts)
+        if kinds == set(["self"]) or len(kinds) == 0:
+            data.extend(elts)
+            return ("self",)
+        if kinds == set(["polynomial"]):
+            names = set(e.parent().variable_name() for e in elts)
+            coeffs = [e.list() for e in elts]
+            if len(names) == 1 and all(self._kind(c) == "self" for l in coeffs for c in l):
+                length = max(len(l) for l in coeffs)
+                for e, l in zip(elts, coeffs):
+                    data.extend(l)
+                    data.extend([e.base_ring().zero()]*(length - len(l)))
+                return ("polynomials", names.pop(), length)
+        return ("each", tuple(self._explode(e, data) for e in elts))
+
+    def _explode(self, elt, data):
+        kind = self._kind(elt)
+        if kind == "list":
+            return ("list", len(elt), self._explode_all(elt, data))
+        elif kind == "tuple":
+            return ("tuple", len(elt), self._explode_all(elt, data))
+        elif kind == "dict":
+            return ("dict", tuple(elt.keys()), self._explode_all(list(elt.values()), data))
+        elif kind == "matrix":
+            return ("matrix", elt.nrows(), elt.ncols(), self._explode_all(elt.list(), data))
+        elif kind == "vector":
+            return ("vector", len(elt), self._explode_all(elt.list(), data))
+        elif kind == "polynomial":
+            l = elt.list()
+            return ("polynomial", elt.parent().variable_name(), len(l), self._explode_all(l, data))
+        elif kind == "ratfun":
+            return ("ratfun", self._explode(elt.numerator(), data), self._explode(elt.denominator(), data))
+        elif kind == "dop":
+            l = elt.list()
+            return ("dop", elt.parent().base_ring().variable_name(), len(l), self._explode_all(l, data))
         else:
-            struct.append("self")
             data.append(elt)
+            return ("self",)
+
+    def shared(self, struct):
+        """The descriptor equal to struct that was seen first, so that equal descriptors are the same object."""
+        return self.structs.setdefault(struct, struct)
 
     def explode(self, elt):
         data = []
-        struct = []
-        self._explode(elt, data, struct)
-        data.reverse()
-        struct.reverse()
-        return (data, tuple(struct))
+        struct = self._explode(elt, data)
+        return (data, self.shared(struct))
 
     def recons(self, data, struct):
-        return self._recons(data, list(struct))
+        return self._recons(data, 0, struct)[0]
+
+    def _polynomial(self, name, l):
+        if len(l) == 0:
+            return 0
+        if not name in self.polrings:
+            self.polrings[name] = PolynomialRing(l[0].parent(), name)
+        return self.polrings[name](l)
+
+    def _recons_all(self, data, pos, struct, n):
+        """Rebuilds a sequence of n elements described by struct from data[pos:], and returns it with the next position."""
+        if struct[0] == "self":
+            return data[pos:pos+n], pos+n
+        elif struct[0] == "polynomials":
+            _, name, length = struct
+            return [self._polynomial(name, data[pos+k*length:pos+(k+1)*length]) for k in range(n)], pos+n*length
+        elif struct[0] == "each":
+            res = []
+            for s in struct[1]:
+                elt, pos = self._recons(data, pos, s)
+                res.append(elt)
+            return res, pos
+        else:
+            raise Exception("Misformed struct")
 
-    def _recons(self, data, struct):
-        next = struct.pop()
+    def _recons(self, data, pos, struct):
+        next = struct[0]
         if next == "list":
-            return [self._recons(data, struct) for i in range(struct.pop())]
+            return self._recons_all(data, pos, struct[2], struct[1])
         elif next == "tuple":
-            return tuple(self._recons(data, struct))
+            l, pos = self._recons_all(data, pos, struct[2], struct[1])
+            return tuple(l), pos
         elif next == "dict":
-            keys = struct.pop()
-            values = self._recons(data, struct)
-            return dict(zip(keys, values))
+            keys = struct[1]
+            values, pos = self._recons_all(data, pos, struct[2], len(keys))
+            return dict(zip(keys, values)), pos
         elif next == "matrix":
-            return Matrix(self._recons(data, struct))
+            _, nrows, ncols, s = struct
+            l, pos = self._recons_all(data, pos, s, nrows*ncols)
+            return Matrix(nrows, ncols, l), pos
         elif next == "vector":
-            return vector(self._recons(data, struct))
+            l, pos = self._recons_all(data, pos, struct[2], struct[1])
+            return vector(l), pos
         elif next == "polynomial":
-            name = struct.pop()
-            l = self._recons(data, struct)
-            if len(l) == 0:
-                return 0
-            else:
-                if not name in self.polrings:
-                    self.polrings[name] = PolynomialRing(l[0].parent(), name)
-                return self.polrings[name](l)
+            _, name, n, s = struct
+            l, pos = self._recons_all(data, pos, s, n)
+            return self._polynomial(name, l), pos
         elif next == "ratfun":
-            numer = self._recons(data, struct)
-            denom = self._recons(data, struct)
-            return numer/denom
+            numer, pos = self._recons(data, pos, struct[1])
+            denom, pos = self._recons(data, pos, struct[2])
+            return numer/denom, pos
         elif next == "dop":
-            name = struct.pop()
-            l = self._recons(data, struct)
+            _, name, n, s = struct
+            l, pos = self._recons_all(data, pos, s, n)
             if len(l) == 0:
-                return 0
+                return 0, pos
             else:
                 Dop, _, _ = DifferentialOperators(l[0].parent().base_ring(), var=name)
-                return Dop(l)
+                return Dop(l), pos
         elif next == "self":
-            return data.pop()
+            return data[pos], pos+1
         else:
             raise Exception("Misformed struct")
 
@@ -273,100 +332,179 @@ class Tick:
     def ticknexttime(self):
         self.i = 1
 
+def _crt_pair(m1, r1, m2, r2):
+    """Combines the residues r1 modulo m1 and r2 modulo m2, entry by entry, with a single modular inversion."""
+    inv = int(inverse_mod(m1, m2))
+    return m1*m2, [a + m1*(((b - a)*inv) % m2) for a, b in zip(r1, r2)]
+
+def _crt_tree(moduli, residues):
+    """Combines the residue arrays modulo pairwise coprime moduli along a product tree.
+    Returns the product of the moduli and the list of combined residues."""
+    if len(moduli) == 1:
+        return moduli[0], list(residues[0])
+    m = len(moduli)//2
+    m1, r1 = _crt_tree(moduli[:m], residues[:m])
+    m2, r2 = _crt_tree(moduli[m:], residues[m:])
+    return _crt_pair(m1, r1, m2, r2)
+
+
 class ModularReconstruction:
     logger = logging.getLogger('numperiods.interpolation.ModularReconstruction')
 
-    def __init__(self, evaluator, modsize=30):
+    def __init__(self, evaluator, modsize=30, parallel=False, evaluations=None):
+        """The residues are kept as machine-word arrays, one per prime, and combined along a product tree when a reconstruction is attempted.
+        The entries are reconstructed one by one, starting with the one that failed at the previous attempt, and an entry already
+        reconstructed is only checked against the new primes. An attempt is made for each new prime, and the reconstruction
+        is returned once all its entries are confirmed by a prime that was not used to reconstruct them.
+
+        If `parallel` is True, the evaluations modulo different primes are computed by batches in a pool of processes.
+        `evaluations` is an optional dictionary of evaluations already computed, indexed by their prime."""
         self.maxprime = 2**modsize
-        self.data = {}
-        self.primes = {}
-        self.cand0 = None
+        self.residues = {}
+        self.combined = {}
+        self.cands = {}
+        self.failed = {}
+        self.primes = set()
         self.evaluator = evaluator
         self.serial = Serial()
-        self.tick = Tick(inc=1)
-
-    def _next(self, prime):
-        if prime in self.primes:
+        self.parallel = parallel
+        self.pool = WorkerPool(_evaluate_modular, evaluator, self.serial)
+        if evaluations is not None:
+            for prime, ev in evaluations.items():
+                self._store(prime, _explode_modular(self.serial, ev))
+
+    def _store(self, prime, exploded):
+        if exploded is None:
+            self.logger.info("Bad evaluation modulo %i, skipping this value." % prime)
             return
+        self.primes.add(prime)
 
-        self.logger.info("Evaluating modulo %i" % prime)
+        data, struct = exploded
+        key = self.serial.shared(struct)
 
-        try:
-            ev = self.evaluator(prime)
-        except ZeroDivisionError:
-            self.logger.info("Bad evaluation, skipping this value.")
-            return
-
-        data, struct = self.serial.explode(ev)
-        key = struct
-
-        if not key in self.data:
-            self.data[key] = data
+        if not key in self.residues:
+            self.residues[key] = {}
+            self.combined[key] = (1, [0]*len(data))
+            self.cands[key] = [None]*len(data)
+            self.failed[key] = 0
         else:
-            assert len(data) == len(self.data[key]), "Evaluations must have the same length for a given key."
-            self.data[key] = [self.data[key][i].crt(data[i]) for i in range(len(data))]
+            assert len(data) == len(self.cands[key]), "Evaluations must have the same length for a given key."
+        self.residues[key][prime] = data
 
         return key
 
+    def _combine(self, key):
+        """The residues of key modulo the product of all its primes, folding in the primes received since the last call."""
+        pending = self.residues[key]
+        if len(pending) > 0:
+            primes = list(pending.keys())
+            modulus, residues = _crt_tree(primes, [pending[p] for p in primes])
+            self.combined[key] = _crt_pair(*self.combined[key], modulus, residues)
+            self.residues[key] = {}
+        return self.combined[key]
+
     def _try_reconstruction(self, key):
-        self.logger.info("Trying modular reconstruction.")
+        modulus, residues = self._combine(key)
+        cands = self.cands[key]
+        confirmed = True
+
+        order = list(range(len(residues)))
+        order = order[self.failed[key]:] + order[:self.failed[key]]
+        for i in order:
+            cand = cands[i]
+            if cand is not None and (cand.numerator() - cand.denominator()*residues[i]) % modulus == 0:
+                continue
+
+            confirmed = False
+            try:
+                cands[i] = rational_reconstruction(residues[i], modulus)
+            except ArithmeticError:
+                self.logger.info("Modular reconstruction failed.")
+                cands[i] = None
+                self.failed[key] = i
+                return None
 
-        cand = []
+        if confirmed:
+            return self.serial.recons(list(cands), key)
+        self.logger.info("Possible reconstruction. Computing modulo one more prime to check.")
+        return None
+
+    def recons(self):
+        batchsize = self.pool.nworkers if self.parallel else 1
         try:
-            for c in self.data[key]:
-                cand.append(c.rational_reconstruction())
-        except ArithmeticError:
-            return None
+            while True:
+                primes = set()
+                while len(primes) < batchsize:
+                    prime = random_prime(self.maxprime, lbound=self.maxprime/128)
+                    if not prime in self.primes:
+                        primes.add(prime)
+                self.logger.info("Evaluating modulo %s" % ", ".join(str(prime) for prime in primes))
+
+                for (prime,), exploded in self.pool.imap([(prime,) for prime in primes]):
+                    key = self._store(prime, exploded)
+                    if key is not None:
+                        cand = self._try_reconstruction(key)
+                        if not cand is None:
+                            return cand
+        finally:
+            self.pool.close()
+
+
+def _evaluate(evaluator, pt):
+    """Evaluates the black box at pt in a worker, None meaning a bad evaluation."""
+    try:
+        return evaluator(pt)
+    except ZeroDivisionError:
+        return None
 
-        if cand == self.cand0:
-            return self.serial.recons(cand, key)
-        else:
-            self.logger.info("Possible reconstruction. Computing modulo one more prime to check.")
-            self.tick.ticknexttime()
-            self.cand0 = cand
-            return None
 
-    def recons(self):
-        pt = Integer(1)
-        while True:
-            pt += 1
-            prime = random_prime(self.maxprime, lbound=self.maxprime/128)
-            key = self._next(prime)
-
-            # We don't always try reconstruction (it is expensive)
-            if self.tick.tick():
-                cand = self._try_reconstruction(key)
-                if not cand is None:
-                    return cand
+def _explode_modular(serial, ev):
+    """The data of an evaluation modulo a prime as an array of machine words, and its descriptor."""
+    if ev is None:
+        return None
+    data, struct = serial.explode(ev)
+    return array('Q', [int(c) for c in data]), struct
+
+
+def _evaluate_modular(evaluator, serial, prime):
+    """Evaluates the black box modulo prime in a worker and explodes the result there,
+    so that only an array of machine words and a small descriptor are sent back."""
+    return _explode_modular(serial, _evaluate(evaluator, prime))
 
 
 class FunctionReconstruction:
     logger = logging.getLogger('numperiods.interpolation.FunctionReconstruction')
 
     def __init__(self, polring, evaluator):
+        """The evaluations at different points are independent: they are computed by batches in a pool of processes,
+        and the results are consumed as they arrive, following the schedule of self.tick."""
         self.polring = polring
         self.serial = Serial()
         self.evaluator = evaluator
+        self.pool = WorkerPool(_evaluate, evaluator)
+        self._reset()
 
+    def _reset(self):
         self.tick = Tick()
         self.data = {}
         self.tests = {}
         self.testsmod = {}
         self.rands = {}
-        self.basering = polring.base_ring()
+        self.basering = self.polring.base_ring()
         if self.basering.characteristic() == 0:
             self.modring = FiniteField(random_prime(10**9))
-            self.modpolring = polring.change_ring(self.modring)
+            self.modpolring = self.polring.change_ring(self.modring)
         else:
             self.modring = self.basering
-            self.modpolring = polring
+            self.modpolring = self.polring
 
     def _next(self, pt):
         self.logger.info("Evaluating at %i" % pt)
-        try:
-            ev = self.evaluator(pt)
-        except ZeroDivisionError:
-            self.logger.info("Bad evaluation, skipping this value.")
+        return self._store(pt, _evaluate(self.evaluator, pt))
+
+    def _store(self, pt, ev):
+        if ev is None:
+            self.logger.info("Bad evaluation at %i, skipping this value." % pt)
             return
 
         data, struct = self.serial.explode(ev)
@@ -391,26 +529,56 @@ class FunctionReconstruction:
 
         return key
 
-    def recons(self, denomapart=False):
+    def recons(self, denomapart=False, degrees=None):
+        """If `degrees` is given, it bounds the degrees of the numerators and of the denominator of the function
+        (in the form returned with denomapart=True). All the points needed are then evaluated in a single batch, and the
+        reconstruction is attempted once. If the bounds turn out to be wrong, the points are added adaptively."""
         pt = Integer(100)
-        while True:
-            pt += 1
-            key = self._next(pt)
-
-            # We don't always try reconstruction (it is expensive)
-            if self.tick.tick():
-                cand = self._try_reconstruction(key, denomapart=denomapart)
-                if not cand is None:
+        try:
+            if degrees is not None:
+                cand, pt = self._recons_with_degrees(pt, degrees, denomapart)
+                if cand is not None:
                     return cand
-
-
-    def _try_reconstruction(self, key, denomapart=False):
+                self.logger.warn("The degree bounds %s do not hold, reconstructing adaptively." % str(degrees))
+
+            while True:
+                # a batch keeps all the workers busy, even when some evaluations take longer
+                batch = [(pt + i + 1,) for i in range(2*self.pool.nworkers)]
+                pt += len(batch)
+                for (p,), ev in self.pool.imap(batch):
+                    key = self._store(p, ev)
+
+                    # We don't always try reconstruction (it is expensive)
+                    if key is not None and self.tick.tick():
+                        cand = self._try_reconstruction(key, denomapart=denomapart)
+                        if not cand is None:
+                            return cand
+        finally:
+            self.pool.close()
+
+    def _recons_with_degrees(self, pt, degrees, denomapart):
+        # two more points than the bounds require, so that wrong bounds are detected with high probability
+        npoints = degrees[0] + degrees[1] + 4
+        key = None
+        while key is None or len(self.tests[key]) < npoints:
+            missing = npoints if key is None else npoints - len(self.tests[key])
+            batch = [(pt + i + 1,) for i in range(missing)]
+            pt += len(batch)
+            for (p,), ev in self.pool.imap(batch):
+                newkey = self._store(p, ev)
+                if newkey is not None:
+                    key = newkey
+        return self._try_reconstruction(key, denomapart=denomapart, degrees=degrees), pt
+
+    def _try_reconstruction(self, key, denomapart=False, degrees=None):
         self.logger.info("Trying rational reconstruction...")
 
         reconmod = self.modpolring.rational_interpolation(self.testsmod[key].items())
         if reconmod is None:
             self.logger.info("Reconstruction failed.")
             return None
+        if degrees is not None and (reconmod[0].degree() > degrees[0] or reconmod[1].degree() > degrees[1]):
+            return None
 
         self.logger.info("Reconstructing denominator...")
 
@@ -434,9 +602,12 @@ class FunctionReconstruction:
         for i in range(nfun):
             self.logger.info("Reconstructing numerator %d of %d..." % (i+1, nfun))
             elt = ei.interpolate([self.data[key][p][i]*evdenom[idx] for idx, p in enumerate(points)])
-            if 3*elt.degree() > 2*len(points):
+            if degrees is not None:
+                if elt.degree() > degrees[0]:
+                    return None
+            elif 3*elt.degree() > 2*len(points):
                 self.logger.warn("The random sampling failed. Should happen very rarely.")
-                self.__init__(self.polring, self.evaluator)
+                self._reset()
                 return None
             if denomapart:
                 cand.append(elt)
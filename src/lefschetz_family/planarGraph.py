@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+# lefschetz-family
+# Copyright (C) 2021  Eric Pichon-Pharabod
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import sage.all
+
+from sage.rings.complex_mpfr import ComplexField
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PlanarGraph(object):
+    def __init__(self, edges, vertices=None):
+        """PlanarGraph(edges, vertices=None)
+
+        A graph whose edges are given as pairs of integer indices of vertices, possibly embedded in the plane by a list of complex `vertices`.
+        The edge k is made of the half-edges 2*k, from edges[k][0] to edges[k][1], and 2*k+1, in the other direction.
+        Half-edges are found from their endpoints in constant time, and the neighbours of a vertex are sorted by angle only once.
+        If an edge appears several times, the half-edges of its first occurrence are used.
+        """
+        self.edges = edges
+        self.vertices = vertices
+        self._half_edges = {}
+        self._adjacency = {}
+        for k, (u, v) in enumerate(edges):
+            if (u, v) in self._half_edges:
+                continue
+            self._half_edges[(u, v)] = 2*k
+            self._half_edges[(v, u)] = 2*k+1
+            self._adjacency.setdefault(u, []).append(v)
+            self._adjacency.setdefault(v, []).append(u)
+        self._rotations = {}
+        self._CC = ComplexField(500)
+
+    def half_edge(self, u, v):
+        """The half-edge from u to v, or None if u and v are not adjacent."""
+        return self._half_edges.get((u, v))
+
+    def origin(self, h):
+        return self.edges[h >> 1][h & 1]
+
+    def target(self, h):
+        return self.edges[h >> 1][1 - (h & 1)]
+
+    def edge_index(self, u, v):
+        """The index of the edge between u and v, or None if u and v are not adjacent."""
+        h = self.half_edge(u, v)
+        return None if h is None else h >> 1
+
+    def has_edge(self, u, v):
+        return (u, v) in self._half_edges
+
+    def neighbors(self, v):
+        """The neighbours of v, in the order of the edges."""
+        return self._adjacency.get(v, [])
+
+    def neighbours(self, v):
+        """The neighbours of v, sorted by the argument of their direction from v, in (-pi, pi].
+        The list is cached and should not be modified."""
+        if v not in self._rotations:
+            z = self._CC(self.vertices[v])
+            self._rotations[v] = sorted(self.neighbors(v), key=lambda w: (self._CC(self.vertices[w]) - z).arg())
+        return self._rotations[v]
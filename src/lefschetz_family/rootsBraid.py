@@ -32,10 +32,9 @@ from sage.misc.flatten import flatten
 from sage.schemes.curves.zariski_vankampen import followstrand
 from sage.functions.other import arg
 
-from sage.parallel.decorate import parallel
-
 
 from .util import Util
+from .workerPool import WorkerPool
 
 import logging
 import time
@@ -111,12 +110,14 @@ class RootsBraid(object):
             self._braidQ = [False]*len(self.edges)
         begin = time.time()
         logger.info("Computing all braids (%d in total).", (len(self.edges)))
-        result = self._compute_braid([(e,i) for i, e in enumerate(self.edges) if not self._braidQ[i]])
+        pool = WorkerPool(RootsBraid._compute_braid, self)
+        result = pool.imap([(e,i) for i, e in enumerate(self.edges) if not self._braidQ[i]])
         for arg, res in result:
             braid, braidinverse = res
-            i, _ =  self.edge(arg[0][0])
+            i, _ =  self.edge(arg[0])
             self._braid[i] = braid, braidinverse
             self._braidQ[i] = True
+        pool.close()
         end = time.time()
         duration_str = time.strftime("%H:%M:%S",time.gmtime(end-begin))
         logger.info("Braids computed in %s."% (duration_str))
@@ -130,14 +131,12 @@ class RootsBraid(object):
         if not self._braidQ[i]:
             logger.info("[%d] Computing braid along edge %d."% (os.getpid(), i))
 
-            res, resinverse = self._compute_braid(e)
-            
-            self._braid[i] = (resinverse, res) if inverse else (res, resinverse)
+            # the braid is computed and stored along the edge as given in self.edges, whatever the orientation of e
+            self._braid[i] = self._compute_braid(self.edges[i], i)
             self._braidQ[i] = True
 
         return self._braid[i][1 if inverse else 0]
 
-    @parallel
     def _compute_braid(self, e, i):
         from sage.schemes.curves.zariski_vankampen import followstrand
         logger.info("[%d] Computing braid along edge %d"% (os.getpid(), i))
@@ -162,7 +161,7 @@ class RootsBraid(object):
         resinverse = [list(reversed([[1-t, x] for t, x in thread])) for thread in res]
         rootsinverse = self.system(e[1])
         endthreads = [thread[0][1] for thread in resinverse]
-        order = [Util.select_closest_index(endthreads, r) for r in rootsinverse]
+        order = Util.select_closest_indices(endthreads, rootsinverse)
         resinverse = [resinverse[i] for i in order]
         return res,resinverse
 
@@ -179,11 +178,7 @@ class RootsBraid(object):
     def minimal_cover_tree(self, section):
         CC=ComplexField(500)
         mtc=Graph(self.npoints+1) 
-        edges = flatten([[(i,j) for i in range(j)] for j in range(self.npoints)], max_level=1) 
-        edges.sort(key=(lambda e: Util.simple_rational(abs(CC(section[e[0]]-section[e[1]])), 10e-10))) # we sort edges by length
-        for e in edges:
-            if len(mtc.shortest_path(e[0], e[1]))==0:
-                mtc.add_edge(e)
+        mtc.add_edges(Util.minimal_spanning_tree(section[:self.npoints]))
         # then we add the path to the basepoint
         vertices = [i for i in range(self.npoints)]
         if self.hasbasepoint:
@@ -250,17 +245,18 @@ class RootsBraid(object):
         self.compute_all_braids()
         begin = time.time()
         logger.info("Computing all isomorphisms.")
-        result = self._compute_isomorphism([e for i, e in enumerate(self.edges) if not self._isomorphismsQ[i]])
+        pool = WorkerPool(RootsBraid._compute_isomorphism, self) # the workers are forked after the braids are computed, so that they know them
+        result = pool.imap([(e,) for i, e in enumerate(self.edges) if not self._isomorphismsQ[i]])
         for arg, res in result:
             iso = res
-            i, _ =  self.edge(arg[0][0])
+            i, _ =  self.edge(arg[0])
             self._isomorphisms[i][0] = iso
             self._isomorphismsQ[i] = True
+        pool.close()
         end = time.time()
         duration_str = time.strftime("%H:%M:%S",time.gmtime(end-begin))
         logger.info("Isomorphisms computed in %s."% (duration_str))
 
-    @parallel
     def _compute_isomorphism(self, e):
         i, inverse = self.edge(e)
         braid = self.braid(e)
@@ -286,7 +282,7 @@ class RootsBraid(object):
         section1 = sections[-1]
         section2 = self.system(e[1]) + self.additional_points
 
-        perm = [Util.select_closest_index(section2,c) for c in section1]+[self.npoints] # this is fine because they are equal (although their presentation might differ)
+        perm = Util.select_closest_indices(section2, section1)+[self.npoints] # this is fine because they are equal (although their presentation might differ)
             
         mtc1 = mtcs[-1]
         mtcfin = self.minimal_cover_tree(section2)
@@ -308,7 +304,7 @@ class RootsBraid(object):
     
     def isomorphism_along_path(self,path):
         """Given a path `path`, computes the braid (as an isomorphism on the fundamental group of the punctured plane) along `path`"""
-        path = [Util.select_closest_index(self.vertices, p)  for p in path]
+        path = Util.select_closest_indices(self.vertices, path)
         edges = [path[i:i+2] for i in range(len(path)-1)] # TODO try product([self.isomorphism(e) for e in list(reversed(path_edges))])
         
         iso = self.isomorphisms(edges[0])
@@ -14,11 +14,15 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import json
 import logging
+import os
+import tempfile
 import time
 
 from sage.all import (
     block_matrix,
+    CDF,
     ComplexBallField,
     diagonal_matrix,
     Frac,
@@ -34,7 +38,7 @@ from ore_algebra.analytic.bounds import BoundPrecisionError
 from ore_algebra.analytic.context import Context, dctx
 from ore_algebra.analytic.dac_sum import HighestSolMapper_dac
 from ore_algebra.analytic.differential_operator import DifferentialOperator
-from ore_algebra.analytic.path import EvaluationPoint_step, Path
+from ore_algebra.analytic.path import EvaluationPoint_step, Path, Step
 from ore_algebra.analytic.utilities import prec_from_eps
 from ore_algebra.tools import clear_denominators
 
@@ -297,6 +301,90 @@ def shifted_int_mat_times_fmat(num, den, pts, Pol, blksz):
     return sources, expr
 
 
+class IntMatTimesFmat:
+    r"""
+    Matrix version of the network built by ``shifted_int_mat_times_fmat`` when
+    all the rows share the same denominator.
+
+    Instead of one chain of stream operations per (point, row, column), the
+    blocks of the solutions are assembled into a block of the matrix ``W`` of
+    their derivatives, and each block costs one product ``num*W`` of
+    polynomial matrices, one division by the common denominator, and one
+    evaluation per point, the powers of the points being shared by all the
+    entries.
+    """
+
+    def __init__(self, num, den, pts, Pol, blksz):
+        self.Pol = Pol
+        self.num = num.change_ring(Pol)
+        self.nsols = num.ncols()
+        self.blksz = blksz
+        # precomputed inverse: den*inv = 1 + x^blksz*rem
+        den = Pol(den)
+        self.inv = den.inverse_series_trunc(blksz)
+        self.rem = (self.inv*den) >> blksz
+        self.pts = pts
+        self.pts_pow = [pt.parent().one() for pt in pts]
+        self.pts_pow_block = [pt**blksz for pt in pts]
+        # state
+        self.pos = 0
+        self.buffer = [Pol.zero()]*self.nsols  # coefficients of the solutions from degree pos
+        self.buffer_len = 0
+        zero = self.num.parent().zero()
+        self.mul_state = zero
+        self.div_num = zero
+        self.div_quo = zero
+        self.values = [zero.change_ring(pt.parent()) for pt in pts]
+
+    def _truncate(self, mat):
+        return mat.apply_map(lambda p: p[:self.blksz])
+
+    def _shift(self, mat):
+        return mat.apply_map(lambda p: p >> self.blksz)
+
+    def push(self, blocks):
+        for j, block in enumerate(blocks):
+            assert block.degree() < self.blksz
+            self.buffer[j] += block << (self.buffer_len)
+        self.buffer_len += self.blksz
+        # the derivatives of order < nsols at degree pos + blksz - 1 are needed
+        while self.buffer_len >= self.blksz + self.nsols - 1:
+            self._process_block()
+
+    def close(self):
+        while self.buffer_len > 0:
+            self._process_block()
+
+    def _process_block(self):
+        Pol, n, bs = self.Pol, self.nsols, self.blksz
+        # block of W[k][j] = (d/dx)^k sol_j, at degrees pos, ..., pos + bs - 1
+        rows = []
+        for k in range(n):
+            factors = [ZZ(self.pos + e + 1).rising_factorial(k) for e in range(bs)]
+            rows.append([Pol([c*f for c, f in zip((ser >> k).padded_list(bs), factors)])
+                         for ser in self.buffer])
+        W = matrix(Pol, n, n, rows)
+        self.mul_state += self.num*W
+        f = self._truncate(self.mul_state)
+        self.mul_state = self._shift(self.mul_state)
+        # division by the common denominator
+        self.div_num += f
+        f0 = self._truncate(self.div_num)
+        self.div_quo += self.inv*f0
+        self.div_num = self._shift(self.div_num) - self.rem*f0
+        quo = self._truncate(self.div_quo)
+        self.div_quo = self._shift(self.div_quo)
+        # integration and evaluation
+        inverses = [~ZZ(self.pos + e + 1) for e in range(bs)]
+        integral = quo.apply_map(lambda p: Pol([c*i for c, i in zip(p.padded_list(bs), inverses)]) << 1)
+        for m, pt in enumerate(self.pts):
+            self.values[m] += self.pts_pow[m]*integral.apply_map(lambda p: p(pt))
+            self.pts_pow[m] *= self.pts_pow_block[m]
+        self.buffer = [ser >> bs for ser in self.buffer]
+        self.buffer_len = max(0, self.buffer_len - bs)
+        self.pos += bs
+
+
 def uncouple(sys, den, vec=None):
     r"""
     Uncouple a differential system (fraction-free).
@@ -345,46 +433,184 @@ class PostIntObserver:
         self.pts = pts
         self.sources = None
         self.expr = None
+        self.stream = None
 
     def reset(self, unr):
         # TODO better choice of prec here? we *are* losing a significant number
         # of digits in this phase too
         Pol = self.num.base_ring().change_ring(ComplexBallField(unr.sums_prec))
-        self.sources, self.expr = shifted_int_mat_times_fmat(
-            self.num, self.den, self.pts, Pol, unr.blksz)
+        if all(d == self.den[0] for d in self.den):
+            self.stream = IntMatTimesFmat(
+                self.num, self.den[0], self.pts, Pol, unr.blksz)
+        else:
+            self.sources, self.expr = shifted_int_mat_times_fmat(
+                self.num, self.den, self.pts, Pol, unr.blksz)
 
     def push_block(self, unr, data):
-        for sol, source in zip(data, self.sources):
+        for sol in data:
             assert len(sol) == 1  # log_prec
+        if self.stream is not None:
+            self.stream.push([sol[0] for sol in data])
+            return
+        for sol, source in zip(data, self.sources):
             source.generate(sol[0])
 
     def finalize(self):  # XXX un peu pourri comme interface
+        if self.stream is not None:
+            self.stream.close()
+            return
         for source in self.sources:
             source.close_input()
 
+    def value(self, m):
+        r"""
+        The matrix of the integrals evaluated at the ``m``-th point.
+        """
+        if self.stream is not None:
+            return self.stream.values[m]
+        return matrix([[self.expr[m][i][j].value
+                        for j in range(self.num.ncols())]
+                       for i in range(self.num.nrows())])
 
-def fundamental_matrices(sys, den, aux, auxden, path, eps, vec=None, ctx=dctx):
 
-    z = den.parent().gen()
-    logger.info("uncoupling...")
-    t0 = time.time()
-    dop, transf = uncouple(sys, den, vec)
-    logger.info("done uncoupling, degree=%s, time=%ss",
-                dop.degree(), time.time() - t0)
-    dop = DifferentialOperator(dop)
-    logger.info("computing transformation...")
-    t0 = time.time()
-    # wasteful
-    itnum, itden = clear_denominators(transf.inverse().list())
-    itnum = matrix(transf.nrows(), transf.ncols(), itnum)
-    # compute these while we are (presumably) working over QQ
-    # XXX pas sûr que ça soit vraiment ce qu'on veut
-    # (ni finalement que ça n'ait une importance maintenant qu'on fait le shift
-    # numériquement)
-    aux1 = aux*itnum
-    auxden1 = auxden*itden
-    logger.info("done, time=%s s", time.time() - t0)
-    dop2 = DifferentialOperator(auxden1*dop)
+class StepController:
+    r"""
+    Predicts how long the steps of the integration can be, as a fraction
+    (``ratio``) of the distance from their start to the closest singular
+    point, from the steps that succeeded or failed before.
+
+    Steps longer than predicted are split before any expansion is computed,
+    and consecutive steps fitting in the predicted length share the same
+    expansion. The prediction is kept from one path to the next, and from one
+    run to the next if ``filename`` is given: the owner of the controller
+    calls ``save``, after merging the ratios learned by its workers.
+    """
+
+    def __init__(self, filename=None, ratio=0.5, min_ratio=1/64, max_ratio=0.9,
+                 grow=1.1, shrink=0.75):
+        self.filename = filename
+        self.ratio = ratio
+        self.min_ratio = min_ratio
+        self.max_ratio = max_ratio
+        self.grow = grow
+        self.shrink = shrink
+        if filename is not None and os.path.exists(filename):
+            try:
+                with open(filename) as f:
+                    self.ratio = json.load(f)["ratio"]
+            except (OSError, ValueError, KeyError):
+                pass
+
+    def step_ratio(self, step):
+        r"""
+        Length of the step relative to the distance from its start to the
+        closest singular point, or None if the start is singular.
+        """
+        rad = float(step.start.dist_to_sing().mid())
+        if rad <= 0:
+            return None
+        z0 = CDF(step.start.as_sage_value())
+        z1 = CDF(step.end.as_sage_value())
+        return abs(z1 - z0)/rad
+
+    def prepare(self, step, max_depth=6):
+        r"""
+        Splits ``step`` until its pieces are shorter than predicted.
+        """
+        r = self.step_ratio(step)
+        if max_depth == 0 or r is None or r <= self.ratio:
+            return [step]
+        return [piece for half in step.split()
+                for piece in self.prepare(half, max_depth - 1)]
+
+    def success(self, step):
+        r = self.step_ratio(step)
+        if r is not None:
+            self.ratio = min(self.max_ratio, max(self.ratio, self.grow*r))
+
+    def failure(self, step):
+        r = self.step_ratio(step)
+        if r is not None:
+            self.ratio = max(self.min_ratio, min(self.ratio, self.shrink*r))
+
+    def merge(self, ratios):
+        r"""
+        Replaces the ratio by the median of the ``ratios`` learned by
+        several copies of the controller, e.g. in forked workers.
+        """
+        ratios = sorted(ratios)
+        self.ratio = ratios[len(ratios)//2]
+
+    def save(self):
+        if self.filename is None:
+            return
+        fd, temp = tempfile.mkstemp(dir=os.path.dirname(self.filename),
+                                    suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"ratio": self.ratio}, f)
+        os.replace(temp, self.filename)
+
+
+class PreparedSystem:
+    r"""
+    The parts of the integration of a system that do not depend on the path:
+    the uncoupled operator, the uncoupling transformation and its inverse, and
+    the integrands expressed in terms of the uncoupled operator.
+
+    Computed once per system, and then shared by the integrations along all
+    the edges.
+    """
+
+    def __init__(self, sys, den, aux, auxden, vec=None, step_controller=None):
+        self.sys = sys
+        self.step_controller = step_controller
+        self.aux = aux
+        self.z = den.parent().gen()
+        logger.info("uncoupling...")
+        t0 = time.time()
+        dop, self.transf = uncouple(sys, den, vec)
+        logger.info("done uncoupling, degree=%s, time=%ss",
+                    dop.degree(), time.time() - t0)
+        self.dop = DifferentialOperator(dop)
+        logger.info("computing transformation...")
+        t0 = time.time()
+        itnum, itden = clear_denominators(self.transf.inverse().list())
+        itnum = matrix(self.transf.nrows(), self.transf.ncols(), itnum)
+        # compute these while we are (presumably) working over QQ
+        # XXX pas sûr que ça soit vraiment ce qu'on veut
+        # (ni finalement que ça n'ait une importance maintenant qu'on fait le shift
+        # numériquement)
+        self.aux1 = aux*itnum
+        self.auxden1 = auxden*itden
+        logger.info("done, time=%s s", time.time() - t0)
+        self.dop2 = DifferentialOperator(self.auxden1*self.dop)
+        # computed here so that they are not computed again for each path
+        self.dop2._singularities()
+        self.dop._singularities()
+
+
+def fundamental_matrices(sys, den, aux, auxden, path, eps, vec=None, ctx=dctx, prepared=None,
+                         max_points=4, bounds_prec=256):
+    r"""
+    Transition matrix along ``path`` of the system given by ``sys`` and
+    ``den``, together with the integrals of ``aux/auxden`` against it.
+
+    The lengths of the steps are chosen by the ``StepController`` of the
+    prepared system. Consecutive steps of the path fitting in the predicted
+    length share the same local expansion, evaluated at (at most
+    ``max_points``) several points. The error bounds are computed with
+    ``bounds_prec`` bits of precision.
+    """
+
+    if prepared is None:
+        prepared = PreparedSystem(sys, den, aux, auxden, vec)
+    if prepared.step_controller is None:
+        prepared.step_controller = StepController()
+    controller = prepared.step_controller
+    z = prepared.z
+    dop, transf = prepared.dop, prepared.transf
+    aux1, auxden1 = prepared.aux1, prepared.auxden1
+    dop2 = prepared.dop2
     # print(len(dop._singularities()), len(dop2._singularities()))
     path = Path(path, dop2)
     # path = Path(path, dop)
@@ -403,7 +629,8 @@ def fundamental_matrices(sys, den, aux, auxden, path, eps, vec=None, ctx=dctx):
     # même si au départ le système ne l'était pas...
     path = path.bypass_singularities()
     # path.check_singularity()
-    path = path.subdivide(1)  # TODO support 2-point mode
+    # one-point subdivision: consecutive steps are merged below into expansions evaluated at up to max_points points
+    path = path.subdivide(1)
     path = path.simplify_points_add_detours(ctx)
     path.check_singularity()
     path.check_convergence()
@@ -413,18 +640,33 @@ def fundamental_matrices(sys, den, aux, auxden, path, eps, vec=None, ctx=dctx):
                               [0, 1]])
     steps = list(path.steps())
     steps.reverse()
+    merge = True
     while steps:
 
         step = steps.pop()
-        logger.info("step %s", step)
+        pieces = controller.prepare(step)
+        step = pieces[0]
+        steps.extend(reversed(pieces[1:]))
+        # The following steps whose ends stay within the predicted length
+        # from step.start are evaluated using the same expansion.
+        group = [step]
+        if merge:
+            while (steps and len(group) < max_points
+                   and steps[-1].end.is_ordinary()):
+                r = controller.step_ratio(Step(step.start, steps[-1].end))
+                if r is None or r > controller.ratio:
+                    break
+                group.append(steps.pop())
+        merge = True
+        msteps = [step] + [Step(step.start, s.end) for s in group[1:]]
+        logger.info("step %s (%d points)", step, len(msteps))
         t0 = time.time()
-        evpts = EvaluationPoint_step([step], jet_order=sys.nrows())
+        evpts = EvaluationPoint_step(msteps, jet_order=sys.nrows())
         deltas = [evpts.approx(Val, i) for i in range(len(evpts))]
         z0 = Val(step.start.as_sage_value())
-        z1 = Val(step.end.as_sage_value())
 
         # TODO bornes d'erreur sur la partie aux
-        # il faut, en gros :
+        # il faut, en gros :
         # - bien comprendre ce qu'on fait exactement avec les derniers
         # coefficients des développements en série des intégrales (toutes les
         # séries en jeu n'étant pas tronquées au même ordre, on se retrouve
@@ -438,7 +680,7 @@ def fundamental_matrices(sys, den, aux, auxden, path, eps, vec=None, ctx=dctx):
             deltas)
         ldop = dop.shift(step.start)
         ctx = Context(ctx=ctx)
-        ctx._set_interval_fields(256)
+        ctx._set_interval_fields(bounds_prec)
         ctx.__coeff_observer=post_integrator
         hsm = HighestSolMapper_dac(ldop, evpts, eps, fail_fast=True,
                                    effort=0,  # ???
@@ -446,33 +688,45 @@ def fundamental_matrices(sys, den, aux, auxden, path, eps, vec=None, ctx=dctx):
         try:
             cols = hsm.run()
         except (BoundPrecisionError, PrecisionError):
-            steps.extend(reversed(step.split()))
+            controller.failure(msteps[-1])
+            if len(group) > 1:
+                # try again with the first step alone
+                steps.extend(reversed(group))
+                merge = False
+            else:
+                steps.extend(reversed(step.split()))
             continue
 
         # XXX redundant with adjacent steps
         transf0 = transf(z0)
-        transf1 = transf(z1)
 
-        fmats = []
-        for m, delta in enumerate(deltas):  # only one iteration for now
+        # keep the farthest point where the result is accurate enough
+        fmat = None
+        for m in range(len(deltas)-1, -1, -1):
+            transf1 = transf(Val(msteps[m].end.as_sage_value()))
+            vmat_aux = post_integrator.value(m)
+            vmat_aux = vmat_aux*~diag*transf0
+            # XXX this is certainly improvable...
+            if any(c.rad() > 2.**(-prec0) and c.accuracy() < prec0//2
+                   for c in vmat_aux.list()):
+                continue
             tmat_dop = matrix([sol.value[m] for sol in cols]).transpose()
             vmat_sys = ~transf1*diag*tmat_dop*~diag*transf0
-            vmat_aux = matrix([[post_integrator.expr[m][i][j].value
-                                for j in range(aux.ncols())]
-                               for i in range(aux.nrows())])
-            vmat_aux = vmat_aux*~diag*transf0
             fmat = block_matrix([[1, vmat_aux], [0, vmat_sys]])
-            fmats.append(fmat)
+            break
 
-        # XXX this is certainly improvable...
-        if any(c.rad() > 2.**(-prec0) and c.accuracy() < prec0//2
-               for c in vmat_aux.list()):
+        if fmat is None:
+            controller.failure(step)
+            steps.extend(reversed(group[1:]))
             steps.extend(reversed(step.split()))
             continue
 
-        [fmat] = fmats
+        controller.success(msteps[m])
+        if m < len(msteps) - 1:
+            controller.failure(msteps[m+1])
+        steps.extend(reversed(group[m+1:]))
         tmat_path = fmat*tmat_path
 
-        logger.info("done with step %s, time=%ss", step, time.time() - t0)
+        logger.info("done with steps %s, time=%ss", group[:m+1], time.time() - t0)
 
     return tmat_path
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+# lefschetz-family
+# Copyright (C) 2021  Eric Pichon-Pharabod
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import sage.all
+
+from sage.rings.complex_mpfr import ComplexField
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SpatialIndex(object):
+    # relative tolerance under which two floating point distances are considered equal
+    _tolerance = 1e-10
+
+    def __init__(self, points):
+        """SpatialIndex(points)
+
+        A k-d tree over double approximations of a list of complex numbers, answering nearest point queries in O(log n).
+        Points at nearly the same floating point distance from the query are compared in ComplexField(500),
+        and ties are broken by taking the smallest index, as a linear scan would.
+        """
+        self.points = points
+        self._CC = ComplexField(500)
+        self._coordinates = [self._double(p) for p in points]
+        self._exact = {}
+        self._scale = max([abs(c) for p in self._coordinates for c in p] + [0.])
+        # the tree is stored in arrays: node k has the point self._nodes[k] and splits along the axis self._axes[k],
+        # its left subtree is stored at positions k+1 to self._middles[k] and its right subtree up to self._ends[k]
+        self._nodes, self._axes, self._middles, self._ends = [], [], [], []
+        self._build(list(range(len(points))), 0)
+
+    def _double(self, z):
+        z = self._CC(z)
+        return (float(z.real()), float(z.imag()))
+
+    def _build(self, indices, depth):
+        if len(indices) == 0:
+            return
+        axis = depth % 2
+        indices.sort(key=lambda i: self._coordinates[i][axis])
+        m = len(indices)//2
+        k = len(self._nodes)
+        self._nodes.append(indices[m])
+        self._axes.append(axis)
+        self._middles.append(None)
+        self._ends.append(None)
+        self._build(indices[:m], depth+1)
+        self._middles[k] = len(self._nodes)
+        self._build(indices[m+1:], depth+1)
+        self._ends[k] = len(self._nodes)
+
+    def _candidates(self, q):
+        """The indices of the points whose floating point distance to q is within tolerance of the smallest one."""
+        best = [float("inf")]
+        candidates = []
+        # absolute slack covering the rounding of the coordinates to doubles
+        slack = 1e-14*max(self._scale, abs(q[0]), abs(q[1])) + 1e-300
+        def visit(k, end):
+            if k >= end:
+                return
+            i = self._nodes[k]
+            x, y = self._coordinates[i]
+            d = ((x-q[0])**2 + (y-q[1])**2)**0.5
+            bound = best[0]*(1+self._tolerance) + slack
+            if d <= bound:
+                candidates.append((d, i))
+                best[0] = min(best[0], d)
+            diff = q[self._axes[k]] - self._coordinates[i][self._axes[k]]
+            near, far = ((k+1, self._middles[k]), (self._middles[k], end)) if diff < 0 else ((self._middles[k], end), (k+1, self._middles[k]))
+            visit(*near)
+            if abs(diff) <= best[0]*(1+self._tolerance) + slack:
+                visit(*far)
+        visit(0, len(self._nodes))
+        bound = best[0]*(1+self._tolerance) + slack
+        return [i for d, i in candidates if d <= bound]
+
+    def _exact_point(self, i):
+        if i not in self._exact:
+            self._exact[i] = self._CC(self.points[i])
+        return self._exact[i]
+
+    def closest_index(self, e):
+        """The index i minimizing abs(self.points[i]-e), the smallest one in case of a tie."""
+        candidates = self._candidates(self._double(e))
+        if len(candidates) == 1:
+            return candidates[0]
+        e = self._CC(e)
+        return min(candidates, key=lambda i: (abs(self._exact_point(i) - e), i))
+
+    def closest(self, e):
+        """The element of self.points closest to e."""
+        return self.points[self.closest_index(e)]
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+# lefschetz-family
+# Copyright (C) 2021  Eric Pichon-Pharabod
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import sage.all
+
+from sage.rings.polynomial.polynomial_ring_constructor import PolynomialRing
+from sage.rings.rational_field import QQ
+from sage.rings.imaginary_unit import I
+from sage.matrix.special import diagonal_matrix
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Symmetry(object):
+    def __init__(self, m, conjugate=False):
+        """Symmetry(m, conjugate=False)
+
+        The map z -> I^m * z, or z -> I^m * conjugate(z) if `conjugate` is True.
+        These are the symmetries of the base that send Gaussian rational points to Gaussian rational points.
+        """
+        self.m = m % 4
+        self.conjugate = conjugate
+
+    def __repr__(self):
+        return "z -> I^%d*%s"% (self.m, "conj(z)" if self.conjugate else "z")
+
+    def __eq__(self, other):
+        return isinstance(other, Symmetry) and (self.m, self.conjugate) == (other.m, other.conjugate)
+
+    def __hash__(self):
+        return hash((self.m, self.conjugate))
+
+    @classmethod
+    def group(cls):
+        """The nontrivial symmetries."""
+        return [cls(m, c) for c in [False, True] for m in range(4) if (m, c) != (0, False)]
+
+    @property
+    def zeta(self):
+        return I**self.m
+
+    def __call__(self, z):
+        return self.zeta * (z.conjugate() if self.conjugate else z)
+
+    def vertex_map(self, vertices):
+        """Given a list of vertices, returns the list of the indices of their images, or None when the image is not a vertex."""
+        index = {v:i for i, v in enumerate(vertices)}
+        return [index.get(self(v)) for v in vertices]
+
+    @classmethod
+    def _gaussian_polynomials(cls, l):
+        """Returns the elements of `l` as polynomials with Gaussian rational coefficients. Raises TypeError if this is not possible."""
+        Pol = PolynomialRing(QQ[I], 't')
+        return [Pol(p) for p in l]
+
+    @classmethod
+    def _real(cls, l):
+        return all([p.map_coefficients(lambda c: c.conjugate()) == p for p in l])
+
+    def leaves_operator_invariant(self, L):
+        """Whether the transition matrices of L along the image of a path can be deduced from the ones along the path.
+        This is the case if L has real coefficients (when the symmetry involves conjugation) and if the operator
+        sum a_k(zeta*t) zeta^-k Dt^k is proportional to L = sum a_k(t) Dt^k."""
+        try:
+            a = self._gaussian_polynomials(L.list())
+        except (TypeError, ValueError):
+            return False
+        if self.conjugate and not self._real(a):
+            return False
+        t = a[0].parent().gen()
+        b = [c(self.zeta*t) / self.zeta**k for k, c in enumerate(a)]
+        return all([bk*a[-1] == ak*b[-1] for ak, bk in zip(a, b)])
+
+    def leaves_system_invariant(self, A, denA):
+        """Whether the transition matrices of the system Y' = A/denA Y along the image of a path can be deduced from the ones along the path.
+        This is the case if the system has real coefficients (when the symmetry involves conjugation) and if zeta*A(zeta*t)/denA(zeta*t) = A(t)/denA(t)."""
+        try:
+            entries = self._gaussian_polynomials(A.list())
+            [den] = self._gaussian_polynomials([denA])
+        except (TypeError, ValueError):
+            return False
+        if self.conjugate and not self._real(entries + [den]):
+            return False
+        t = den.parent().gen()
+        return all([self.zeta*c(self.zeta*t)*den == c*den(self.zeta*t) for c in entries])
+
+    def transform_jets(self, M):
+        """Given the transition matrix M of an invariant operator along a path, returns its transition matrix along the image of the path.
+        The initial conditions being the successive derivatives f^(k)/k!, it is D^-1 * M * D with D = diag(zeta^k), after conjugation if needed."""
+        if self.conjugate:
+            M = M.conjugate()
+        if self.m == 0:
+            return M
+        zeta = M.base_ring()(0,1)**self.m
+        D = diagonal_matrix(M.base_ring(), [zeta**k for k in range(M.nrows())])
+        return D.inverse() * M * D
+
+    def transform_values(self, M):
+        """Given the transition matrix M of an invariant system along a path, returns its transition matrix along the image of the path."""
+        return M.conjugate() if self.conjugate else M
@@ -17,13 +17,13 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 
-from sage.misc.flatten import flatten
 from sage.graphs.graph import Graph
 from sage.groups.free_group import FreeGroup
 
 from sage.rings.complex_mpfr import ComplexField
 
 from .util import Util
+from .planarGraph import PlanarGraph
 
 import logging
 
@@ -46,7 +46,7 @@ class Translator(object):
     @property
     def AtoB(self):
         if not hasattr(self, "_AtoB"):
-            self._AtoB = [Util.select_closest_index(self.B.qpoints, p) for p in self.A.qpoints]
+            self._AtoB = Util.select_closest_indices(self.B.qpoints, self.A.qpoints)
         return self._AtoB
 
     
@@ -55,11 +55,7 @@ class Translator(object):
         """This tree will serve as the alphabet for the fundamental group"""
         if not hasattr(self, "_edges_tree"):
             minimal_cover_tree = Graph(len(self.A.qpoints)) 
-            edges = flatten([[(i,j) for i in range(j)] for j in range(len(self.A.qpoints))], max_level=1) 
-            edges.sort(key=(lambda e: Util.simple_rational(abs(CC(self.A.qpoints[e[0]]-self.A.qpoints[e[1]])), 10e-10))) # we sort edges by length
-            for e in edges:
-                if len(minimal_cover_tree.shortest_path(e[0], e[1]))==0:
-                    minimal_cover_tree.add_edge(e)
+            minimal_cover_tree.add_edges(Util.minimal_spanning_tree(self.A.qpoints))
             self._edges_tree = [list(e)[:2] for e in minimal_cover_tree.edges()]
         return self._edges_tree
     
@@ -77,8 +73,10 @@ class Translator(object):
     def Bduality(self):
         if not hasattr(self, "_Bduality"):
             edgesB = []
+            seen = set()
             for e,d in self.B.duality:
-                if d not in edgesB and list(reversed(d)) not in edgesB:
+                if (d[0], d[1]) not in seen:
+                    seen.update([(d[0], d[1]), (d[1], d[0])])
                     edgesB += [d]
 
             delaunay = Graph()
@@ -91,14 +89,14 @@ class Translator(object):
             for e in edgesA:
                 paths += [delaunay.shortest_path(e[0], e[1], by_weight=True)] 
 
+            primal = {}
+            for e2,d2 in self.B.duality:
+                primal.setdefault((d2[0], d2[1]), e2)
             Bduality = []
             for dA, path in zip(self.edges_tree, paths):
                 for i in range(len(path)-1):
-                    e = path[i:i+2]
-                    for e2,d2 in self.B.duality:
-                        if d2 == e:
-                            Bduality += [[e2, dA]]
-                            break
+                    if (path[i], path[i+1]) in primal:
+                        Bduality += [[primal[(path[i], path[i+1])], dA]]
             self._Bduality = Bduality
         return self._Bduality
 
@@ -111,22 +109,21 @@ class Translator(object):
     
     @classmethod
     def word(self, path, duality, edges, alphabet=None):
-        dual_temp = [[e,d] for e,d in duality if d in edges]
-        dual_temp.sort(key=lambda e: edges.index(e[1]))
-        edges_temp = [e for e,_ in dual_temp]
+        """Given a path, return its word in the letters dual to `edges`, according to the list of pairs [edge, dual edge] `duality`."""
+        tree = PlanarGraph(edges)
+        # each edge of the path crossing an edge of the tree, in the orientation in which the tree edge is given, gives a letter
+        letter_of = {}
+        for e, d in sorted([(e, d) for e, d in duality if tree.half_edge(d[0], d[1]) != None and tree.half_edge(d[0], d[1]) & 1 == 0], key=lambda ed: tree.edge_index(*ed[1])):
+            letter_of.setdefault((e[0], e[1]), tree.edge_index(d[0], d[1]))
         if alphabet==None:
             alphabet = FreeGroup(len(edges))
         w = alphabet(1)
         letters = alphabet.gens()
         for i in range(len(path)-1):
-            e = path[i:i+2]
-            if e in edges_temp:
-                dual = dual_temp[edges_temp.index(e)][1]
-                w = letters[edges.index(dual)]**-1 * w
-            e = list(reversed(e))
-            if e in edges_temp:
-                dual = dual_temp[edges_temp.index(e)][1]
-                w = letters[edges.index(dual)] * w
+            if (path[i], path[i+1]) in letter_of:
+                w = letters[letter_of[(path[i], path[i+1])]]**-1 * w
+            if (path[i+1], path[i]) in letter_of:
+                w = letters[letter_of[(path[i+1], path[i])]] * w
         return w
     
     @property
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+
+# lefschetz-family
+# Copyright (C) 2021  Eric Pichon-Pharabod
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from fractions import Fraction
+
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+
+
+def to_fraction(q):
+    """Converts a rational number (python or sage) to a Fraction."""
+    if isinstance(q, (int, float, Fraction)):
+        return Fraction(q)
+    return Fraction(int(q.numerator()), int(q.denominator()))
+
+
+def _hilbert_index(x, y, order=16):
+    """The index of the cell (x, y) of a 2^order x 2^order grid along the Hilbert curve."""
+    d = 0
+    s = 1 << (order-1)
+    while s > 0:
+        rx = 1 if x & s else 0
+        ry = 1 if y & s else 0
+        d += s * s * ((3 * rx) ^ ry)
+        if ry == 0:
+            if rx == 1:
+                x, y = s-1 - (x % s), s-1 - (y % s)
+            x, y = y, x
+        s >>= 1
+    return d
+
+
+class DelaunayTriangulation(object):
+    # relative error bound of the floating point filters, generous enough to account for the rounding of the inputs
+    _filter = 1e-12
+
+    def __init__(self, points):
+        """DelaunayTriangulation(points)
+
+        The Delaunay triangulation of a list of distinct points of the plane, given by exact rational coordinates,
+        computed by incremental insertion (Bowyer-Watson) along a Hilbert curve. Points can be inserted afterwards with `insert`.
+        The vertices of the enclosing triangle have negative indices.
+        The geometric predicates are evaluated in floating point arithmetic, and exactly when the floating point result is not certified.
+        """
+        self._exact = {i:(to_fraction(x), to_fraction(y)) for i, (x, y) in enumerate(points)}
+        self.npoints = len(self._exact)
+        self._build()
+
+    def _orient(self, a, b, c):
+        """Sign of the orientation of the triangle abc (positive if counterclockwise)."""
+        (ax, ay), (bx, by), (cx, cy) = self._floats[a], self._floats[b], self._floats[c]
+        detleft = (ax-cx)*(by-cy)
+        detright = (ay-cy)*(bx-cx)
+        det = detleft - detright
+        if abs(det) > self._filter*(abs(detleft) + abs(detright)):
+            return 1 if det > 0 else -1
+        (ax, ay), (bx, by), (cx, cy) = self._exact[a], self._exact[b], self._exact[c]
+        det = (ax-cx)*(by-cy) - (ay-cy)*(bx-cx)
+        return (det > 0) - (det < 0)
+
+    def _incircle(self, a, b, c, d):
+        """Positive if d is inside the circumcircle of the counterclockwise triangle abc, negative if outside, zero if on it."""
+        res = self._incircle_det(self._floats, a, b, c, d)
+        if res is not None:
+            return res
+        return self._incircle_det(self._exact, a, b, c, d, exact=True)
+
+    def _incircle_det(self, coordinates, a, b, c, d, exact=False):
+        (ax, ay), (bx, by), (cx, cy), (dx, dy) = coordinates[a], coordinates[b], coordinates[c], coordinates[d]
+        adx, ady, bdx, bdy, cdx, cdy = ax-dx, ay-dy, bx-dx, by-dy, cx-dx, cy-dy
+        alift, blift, clift = adx*adx + ady*ady, bdx*bdx + bdy*bdy, cdx*cdx + cdy*cdy
+        t1, t2, t3 = alift*(bdx*cdy - bdy*cdx), blift*(cdx*ady - cdy*adx), clift*(adx*bdy - ady*bdx)
+        det = t1 + t2 + t3
+        if not exact:
+            permanent = (alift*(abs(bdx*cdy) + abs(bdy*cdx)) + blift*(abs(cdx*ady) + abs(cdy*adx)) + clift*(abs(adx*bdy) + abs(ady*bdx)))
+            if abs(det) <= self._filter*permanent:
+                return None
+        return (det > 0) - (det < 0)
+
+    def _add_triangle(self, a, b, c):
+        t = self._next_id
+        self._next_id += 1
+        self._triangles[t] = (a, b, c)
+        for e in ((a, b), (b, c), (c, a)):
+            self._edges[e] = t
+        for v in (a, b, c):
+            self._vertex_triangle[v] = t
+        return t
+
+    def _remove_triangle(self, t):
+        a, b, c = self._triangles.pop(t)
+        for e in ((a, b), (b, c), (c, a)):
+            del self._edges[e]
+
+    def _build(self):
+        xs = [p[0] for p in self._exact.values()]
+        ys = [p[1] for p in self._exact.values()]
+        xmin, xmax, ymin, ymax = min(xs), max(xs), min(ys), max(ys)
+        span = max(xmax - xmin, ymax - ymin, Fraction(1))
+        cx, cy = (xmin + xmax)/2, (ymin + ymax)/2
+        M = 1000*span
+        # the vertices of a triangle containing all the points, far enough not to interfere with the triangles of the points
+        self._exact.update({-3:(cx - 3*M, cy - 3*M), -2:(cx + 3*M, cy - 3*M), -1:(cx, cy + 3*M)})
+        self._floats = {i:(float(x), float(y)) for i, (x, y) in self._exact.items()}
+        self._triangles = {}
+        self._edges = {}
+        self._vertex_triangle = {}
+        self._next_id = 0
+        self._last = self._add_triangle(-3, -2, -1)
+        self._insert_all(range(self.npoints))
+
+    def _insert_all(self, indices):
+        """Inserts the points of index in `indices`, following a Hilbert curve on their bounding box."""
+        if len(indices) == 0:
+            return
+        xs = [self._floats[i][0] for i in indices]
+        ys = [self._floats[i][1] for i in indices]
+        fx, fy = min(xs), min(ys)
+        scale = max(max(xs) - fx, max(ys) - fy) or 1.
+        grid = (1 << 16) - 1
+        order = sorted(indices, key=lambda i: _hilbert_index(int((self._floats[i][0]-fx)/scale*grid), int((self._floats[i][1]-fy)/scale*grid)))
+        for i in order:
+            self._last = self._insert(i, self._last)
+
+    def insert(self, points):
+        """Inserts new points, given by exact rational coordinates, and returns their indices.
+        The triangles whose circumcircle does not contain a new point are kept, with the same identifiers.
+        Raises ValueError if a point is outside the enclosing triangle."""
+        points = [(to_fraction(x), to_fraction(y)) for x, y in points]
+        indices = list(range(self.npoints, self.npoints + len(points)))
+        for i, p in zip(indices, points):
+            self._exact[i] = p
+            self._floats[i] = (float(p[0]), float(p[1]))
+        if any([self._orient(u, v, i) <= 0 for i in indices for u, v in ((-3, -2), (-2, -1), (-1, -3))]):
+            for i in indices:
+                del self._exact[i], self._floats[i]
+            raise ValueError("the points should be inside the enclosing triangle")
+        self.npoints += len(points)
+        self._insert_all(indices)
+        if hasattr(self, "_voronoi_vertices"):
+            del self._voronoi_vertices
+        return indices
+
+    def _locate(self, p, t):
+        """Walks from the triangle t to a triangle containing p."""
+        while True:
+            a, b, c = self._triangles[t]
+            for u, v in ((a, b), (b, c), (c, a)):
+                if self._orient(u, v, p) < 0:
+                    t = self._edges[(v, u)]
+                    break
+            else:
+                return t
+
+    def _insert(self, p, t):
+        t = self._locate(p, t)
+        cavity = set([t])
+        stack = [t]
+        while len(stack) > 0:
+            u = stack.pop()
+            a, b, c = self._triangles[u]
+            for e in ((a, b), (b, c), (c, a)):
+                v = self._edges.get((e[1], e[0]))
+                if v is not None and v not in cavity and self._incircle(*self._triangles[v], p) > 0:
+                    cavity.add(v)
+                    stack.append(v)
+        boundary = []
+        for u in cavity:
+            a, b, c = self._triangles[u]
+            for e in ((a, b), (b, c), (c, a)):
+                if self._edges.get((e[1], e[0])) not in cavity:
+                    boundary.append(e)
+        for u in cavity:
+            self._remove_triangle(u)
+        new = [self._add_triangle(a, b, p) for a, b in boundary]
+        return new[0]
+
+    @property
+    def triangles(self):
+        """The triangles, as counterclockwise triples of indices of points."""
+        return [tr for tr in self._triangles.values() if min(tr) >= 0]
+
+    def edges(self):
+        """The edges between the points, as pairs of indices (i, j) with i<j."""
+        return [(a, b) for (a, b) in self._edges if 0 <= a < b]
+
+    def hull(self):
+        """The indices of the points on the convex hull, i.e. connected to the enclosing triangle."""
+        return sorted(set([a for (a, b) in self._edges if a >= 0 and b < 0]))
+
+    def min_distance(self):
+        """The smallest distance between two of the points, as a float."""
+        return min([math.dist(self._floats[a], self._floats[b]) for a, b in self.edges()])
+
+    def nearest_distances(self):
+        """For each point, the distance to the closest other point, as a float."""
+        distances = [float("inf")]*self.npoints
+        for a, b in self.edges():
+            d = math.dist(self._floats[a], self._floats[b])
+            distances[a] = min(distances[a], d)
+            distances[b] = min(distances[b], d)
+        return distances
+
+    def circumcenter(self, t):
+        """The circumcenter of the triangle t and its circumradius, as floats."""
+        (ax, ay), (bx, by), (cx, cy) = [self._floats[v] for v in self._triangles[t]]
+        bx, by, cx, cy = bx-ax, by-ay, cx-ax, cy-ay
+        d = 2*(bx*cy - by*cx)
+        ux = (cy*(bx*bx + by*by) - by*(cx*cx + cy*cy))/d
+        uy = (bx*(cx*cx + cy*cy) - cx*(bx*bx + by*by))/d
+        return ax + ux, ay + uy, math.hypot(ux, uy)
+
+    def shortest_side(self, t):
+        """The length of the shortest side of the triangle t, as a float."""
+        a, b, c = [self._floats[v] for v in self._triangles[t]]
+        return min(math.dist(a, b), math.dist(b, c), math.dist(c, a))
+
+    def star(self, i):
+        """The triangles around the point i, in counterclockwise order."""
+        start = self._vertex_triangle[i]
+        res = []
+        t = start
+        while True:
+            res.append(t)
+            a, b, c = self._triangles[t]
+            nxt = {a: c, b: a, c: b}[i] # the vertex following i in the triangle (i, b, c) is c, and the next triangle contains the edge (i, c)
+            t = self._edges.get((i, nxt))
+            if t is None or t == start:
+                return res
+
+    def voronoi_cell(self, i):
+        """The Voronoi vertices around the point i, in counterclockwise order, given as identifiers of triangles.
+        Triangles with the same circumcircle have the same identifier."""
+        return [self.voronoi_vertex(t) for t in self.star(i)]
+
+    def voronoi_vertex(self, t):
+        """A canonical triangle among the triangles with the same circumcircle as t."""
+        if not hasattr(self, "_voronoi_vertices"):
+            self._voronoi_vertices = {}
+        if t not in self._voronoi_vertices:
+            # the triangles with the same circumcircle are connected by edges whose opposite vertex is on the circumcircle
+            component = set([t])
+            stack = [t]
+            while len(stack) > 0:
+                u = stack.pop()
+                a, b, c = self._triangles[u]
+                for e in ((a, b), (b, c), (c, a)):
+                    v = self._edges.get((e[1], e[0]))
+                    if v is None or v in component:
+                        continue
+                    d = [w for w in self._triangles[v] if w not in e][0]
+                    if self._incircle(a, b, c, d) == 0:
+                        component.add(v)
+                        stack.append(v)
+            representative = min(component)
+            for u in component:
+                self._voronoi_vertices[u] = representative
+        return self._voronoi_vertices[t]
@@ -20,6 +20,7 @@ import sage.all
 
 from ore_algebra import *
 from sage.rings.complex_mpfr import ComplexField
+from sage.rings.real_mpfr import RealField
 from sage.functions.other import floor
 from sage.arith.misc import gcd
 from sage.arith.misc import xgcd
@@ -32,6 +33,8 @@ from sage.modules.free_module_element import vector
 from sage.misc.prandom import randint, shuffle
 
 from .numperiods.integerRelations import IntegerRelations
+from .spatialIndex import SpatialIndex
+from .triangulation import DelaunayTriangulation
 
 import logging
 
@@ -151,6 +154,52 @@ class Util(object):
                 r = i
         return r
 
+    @classmethod
+    def select_closest_indices(cls, l, es):
+        """Given a list of complex numbers l and a list of complex numbers es, return for each e of es the index i minimizing abs(l[i]-e)"""
+        index = SpatialIndex(l)
+        return [index.closest_index(e) for e in es]
+
+    @classmethod
+    def minimal_spanning_tree(cls, l):
+        """Given a list of complex numbers l, returns the edges (i, j), with i<j, of a minimal spanning tree of the complete graph on l weighted by distances, in the order in which Kruskal's algorithm finds them.
+        Only the edges of the Delaunay triangulation are considered, as they contain a minimal spanning tree. Distances are compared in double precision,
+        and in ComplexField(500) when they are too close to be distinguished. Edges of equal length are taken by increasing j, then i."""
+        CC = ComplexField(500)
+        coordinates = [complex(CC(p)) for p in l]
+        n = len(l)
+        if n > 2 and len(set(coordinates)) == n:
+            candidates = DelaunayTriangulation([(z.real, z.imag) for z in coordinates]).edges()
+        else:
+            candidates = [(i, j) for j in range(n) for i in range(j)]
+        candidates = sorted([(abs(coordinates[i] - coordinates[j]), j, i) for i, j in candidates])
+
+        RF = RealField(100)
+        k = 0
+        while k < len(candidates):
+            m = k + 1
+            while m < len(candidates) and candidates[m][0] - candidates[m-1][0] <= 1e-12*candidates[m][0]:
+                m += 1
+            if m > k + 1:
+                candidates[k:m] = sorted(candidates[k:m], key=lambda c: (RF(abs(CC(l[c[1]]) - CC(l[c[2]]))), c[1], c[2]))
+            k = m
+
+        component = list(range(n))
+        def find(i):
+            while component[i] != i:
+                component[i] = component[component[i]]
+                i = component[i]
+            return i
+        tree = []
+        for _, j, i in candidates:
+            ci, cj = find(i), find(j)
+            if ci != cj:
+                component[ci] = cj
+                tree += [(i, j)]
+                if len(tree) == n-1:
+                    break
+        return tree
+
     @classmethod
     def is_clockwise(cls, l):
         """Given a list of complex numbers describing a convex polygon, return whether the points are clockwise."""
@@ -22,20 +22,30 @@ from sage.rings.rational_field import QQ
 from sage.rings.complex_mpfr import ComplexField
 from sage.graphs.graph import Graph
 from sage.rings.imaginary_unit import I
-from sage.functions.other import arg
+from sage.functions.other import ceil
 
-from sage.geometry.voronoi_diagram import VoronoiDiagram
 from sage.misc.flatten import flatten
 
-from sage.graphs.spanning_tree import boruvka
 
+import copy
+import heapq
+import logging
 import os
 
 from .util import Util
+from .triangulation import DelaunayTriangulation
+from .spatialIndex import SpatialIndex
+from .planarGraph import PlanarGraph
+from .costModel import EdgeCostModel
+
+logger = logging.getLogger(__name__)
 
 class FundamentalGroupVoronoi(object):
     def __init__(self, points, basepoint, border=5):
-        """FundamentalGroupVoronoi(points, basepoint)
+        """FundamentalGroupVoronoi(points, basepoint, border=5)
+
+        If `border` is None, the number of points added on each side of the box around the points is chosen
+        according to the number of points on their convex hull, so that the cells of these points stay well shaped.
         """
         assert basepoint not in points
 
@@ -58,11 +68,20 @@ class FundamentalGroupVoronoi(object):
     def complex_number_to_point(self, z):
         return (QQ(z.real()), QQ(z.imag()))
 
+    @property
+    def nearest_distances(self):
+        """For each point, the distance to the closest other point, as a float."""
+        if not hasattr(self, "_nearest_distances"):
+            # the closest point is a neighbour in the Delaunay triangulation
+            triangulation = DelaunayTriangulation([(float(self.CC(p).real()), float(self.CC(p).imag())) for p in self._points])
+            self._nearest_distances = triangulation.nearest_distances()
+        return self._nearest_distances
+
     @property
     def prec(self):
         if not hasattr(self, "_prec"):
-            points_differences = flatten([[self.CC(self._points[i]) - self.CC(self._points[j]) for j in range(i)] for i in range(len(self._points))])
-            self._prec = Util.simple_rational(min([abs(p) for p in points_differences]), min([abs(p) for p in points_differences])/100)/100
+            distance = self.CC(min(self.nearest_distances)).real()
+            self._prec = Util.simple_rational(distance, distance/100)/100
         return self._prec
     
     @property
@@ -84,9 +103,11 @@ class FundamentalGroupVoronoi(object):
         """
         if not hasattr(self, "_edges"):
             edges = []
+            seen = set()
             for center, polygon in self.polygons:
                 for e in polygon:
-                    if e not in edges and [e[1], e[0]] not in edges:
+                    if (e[0], e[1]) not in seen:
+                        seen.update([(e[0], e[1]), (e[1], e[0])])
                         edges += [e]
                 if center == self.qpoints[0]:
                     connection_to_basepoint = min([i for i in flatten(polygon)], key=lambda i: abs(self.vertices[0] - self.vertices[i]))
@@ -97,6 +118,9 @@ class FundamentalGroupVoronoi(object):
 
     @property
     def border(self):
+        if self._border == None:
+            triangulation = DelaunayTriangulation([self.complex_number_to_point(z) for z in self.qpoints])
+            self._border = max(5, ceil(len(triangulation.hull())/2))
         return self._border
 
     @property
@@ -109,9 +133,11 @@ class FundamentalGroupVoronoi(object):
     def duality(self):
         if not hasattr(self, "_duality"):
             duality= [[] for e in self.edges]
+            edge_index = {(e[0], e[1]):i for i, e in enumerate(self.edges)}
+            site_index = {c:k for k, c in enumerate(self.qpoints)} # sort_loops reorders the points but not the polygons
             for c, pol in self.polygons:
                 for e in pol:
-                    duality[self.edges.index(e)] += [Util.select_closest_index(self.points, c)]
+                    duality[edge_index[(e[0], e[1])]] += [site_index[c]]
             duality = [[self.edges[i], d] for i, d in enumerate(duality) if len(d)==2]
             for i,du in enumerate(duality):
                 e,d = du
@@ -125,17 +151,78 @@ class FundamentalGroupVoronoi(object):
             self._duality = duality
         return self._duality
 
+    @property
+    def edge_costs(self):
+        """For each edge, an estimate of the cost of integrating along it: one step, plus its length relative to its distance to the closest critical point.
+        The closest critical points of an edge of the Voronoi graph are the centers of the cells it bounds."""
+        if not hasattr(self, "_edge_costs"):
+            edge_index = {(e[0], e[1]):i for i, e in enumerate(self.edges)}
+            sites = [[] for e in self.edges]
+            site_index = {c:k for k, c in enumerate(self.qpoints)}
+            for c, pol in self.polygons:
+                for e in pol:
+                    if (e[0], e[1]) in edge_index:
+                        sites[edge_index[(e[0], e[1])]] += [site_index[c]]
+            critical = [complex(self.CC(p)) for p in self.qpoints]
+            index = SpatialIndex(self.qpoints[1:])
+            costs = []
+            for e, s in zip(self.edges, sites):
+                a, b = [complex(self.CC(self.vertices[v])) for v in e]
+                s = [k for k in s if k != 0]
+                if len(s) == 0: # edges around the basepoint only
+                    s = [1 + index.closest_index(z) for z in [a, (a+b)/2, b]]
+                distance = min([EdgeCostModel._distance_to_segment(critical[k], a, b) for k in s])
+                costs += [1 + abs(b-a)/max(distance, 1e-30)]
+            self._edge_costs = costs
+        return self._edge_costs
+
     @property
     def graph(self):
         if not hasattr(self, "_graph"):
-            self._graph = Graph([(e[0], e[1], self.rationalize(abs(self.vertices[e[0]] - self.vertices[e[1]]))) for e in self.edges])
+            self._graph = Graph([(e[0], e[1], c) for e, c in zip(self.edges, self.edge_costs)])
         return self._graph
 
+    @property
+    def planar_graph(self):
+        if not hasattr(self, "_planar_graph"):
+            self._planar_graph = PlanarGraph(self.edges, self.vertices)
+        return self._planar_graph
+
+    def _shortest_path_tree(self):
+        """Computes the cheapest paths from the basepoint to all the vertices for the estimated costs of the edges, in a single pass of Dijkstra's algorithm."""
+        adjacency = {}
+        for e, c in zip(self.edges, self.edge_costs):
+            adjacency.setdefault(e[0], []).append((e[1], c))
+            adjacency.setdefault(e[1], []).append((e[0], c))
+        distances, parents = {0:0}, {0:None}
+        heap = [(0, 0)]
+        done = set()
+        while len(heap) > 0:
+            d, v = heapq.heappop(heap)
+            if v in done:
+                continue
+            done.add(v)
+            for w, c in adjacency.get(v, []):
+                if w not in distances or d + c < distances[w]:
+                    distances[w] = d + c
+                    parents[w] = v
+                    heapq.heappush(heap, (d + c, w))
+        self._distances = distances
+        self._parents = parents
+        self._tree = Graph([(v, p) for v, p in parents.items() if p != None])
+
+    @property
+    def distances(self):
+        """The estimated cost of the cheapest path from the basepoint to each vertex."""
+        if not hasattr(self, "_distances"):
+            self._shortest_path_tree()
+        return self._distances
+
     @property
     def tree(self):
+        """The tree of the cheapest paths from the basepoint."""
         if not hasattr(self, "_tree"):
-            tree_edges = boruvka(self.graph)
-            self._tree = Graph(tree_edges)
+            self._shortest_path_tree()
         return self._tree
 
     @property
@@ -143,7 +230,7 @@ class FundamentalGroupVoronoi(object):
         if not hasattr(self, "_loop_points"):
             loop_points = []
             for i, loop in enumerate(self.loops):
-                loop_point = min(loop[1:], key=lambda v:self.tree.distance(v,0, by_weight=True))
+                loop_point = min(loop[1:], key=lambda v:self.distances[v])
                 index = loop.index(loop_point)
                 if index!=0:
                     loop = loop[index:-1] + loop[:index] + [loop[index]]
@@ -155,7 +242,14 @@ class FundamentalGroupVoronoi(object):
     @property
     def paths(self):
         if not hasattr(self, "_paths"):
-            self._paths = [self.tree.all_paths(0, v)[0] for v in self.loop_points]
+            self.tree
+            paths = []
+            for v in self.loop_points:
+                path = [v]
+                while self._parents[path[-1]] != None:
+                    path += [self._parents[path[-1]]]
+                paths += [list(reversed(path))]
+            self._paths = paths
         return self._paths
     
     @property
@@ -165,7 +259,6 @@ class FundamentalGroupVoronoi(object):
             for i in range(len(self.points)-1):
                 pointed_loops += [self.paths[i][:-1] + self.loops[i] + list(reversed(self.paths[i][:-1]))]
             self._pointed_loops = pointed_loops
-            del self._voronoi_diagram # this is to allow saving; save pickle
         return self._pointed_loops
     
     
@@ -200,24 +293,27 @@ class FundamentalGroupVoronoi(object):
     def minimal_tree(self):
         if not hasattr(self, "_minimal_tree"):
             edges = []
+            seen = set()
             for path in self.paths:
                 for i in range(len(path)-1):
                     e0 = path[i]
                     e1 = path[i+1]
-                    if [e0,e1] not in edges and [e1,e0] not in edges:
+                    if (e0, e1) not in seen:
+                        seen.update([(e0, e1), (e1, e0)])
                         edges+=[[e0, e1]]
-            self._minimal_tree = Graph(edges)
+            self._minimal_tree = PlanarGraph(edges)
         return self._minimal_tree
 
-    def neighbours(self, v): # maybe this shoudl be done only once?
-        neighbours = self.graph.neighbors(v)
-        neighbours.sort(key=lambda v2:arg(self.vertices[v2] - self.vertices[v]))
-        return neighbours
+    def neighbours(self, v):
+        return self.planar_graph.neighbours(v)
 
     def sort_loops(self):
         order = self._sort_loops_rec(0)
         self._points = [self.points[0]] + [self.points[i+1] for i in order]
         self._qpoints = [self.qpoints[0]] + [self.qpoints[i+1] for i in order]
+        self._sites = [self._sites[0]] + [self._sites[i+1] for i in order]
+        if hasattr(self, "_nearest_distances"):
+            self._nearest_distances = [self._nearest_distances[0]] + [self._nearest_distances[i+1] for i in order]
         self._loops = [self.loops[i] for i in order]
         self._paths = [self.paths[i] for i in order]
         if hasattr(self, "_pointed_loops"):
@@ -227,9 +323,7 @@ class FundamentalGroupVoronoi(object):
     def adapted_loops(self, subvoronoi):
         for v in subvoronoi.points:
             assert v in self.points
-        correspondance = []
-        for v in subvoronoi.vertices:
-            correspondance += [Util.select_closest_index(self.vertices,v)]
+        correspondance = Util.select_closest_indices(self.vertices, subvoronoi.vertices)
         adapted_loops = []
         for loop in subvoronoi.pointed_loops:
             adapted_loop = [correspondance[loop[0]]]
@@ -238,19 +332,75 @@ class FundamentalGroupVoronoi(object):
             adapted_loops += [adapted_loop]
         return adapted_loops
 
-
-    def _sort_loops_rec(self, v, parent=None, depth=0):
+    def insert_points(self, points, basepoint=None):
+        """Returns the FundamentalGroupVoronoi of the points of self together with `points`, with the same border.
+        If `basepoint` is given and differs from the basepoint of self, the former basepoint becomes one of the points.
+
+        The rational approximations of the former points are kept when they are precise enough, and the new points are inserted
+        in the Delaunay triangulation of self when the border does not change. As the vertices are rationalized locally,
+        the cells that are not affected by the new points keep exactly the same vertices, and the transition matrices
+        along their edges are found in the edge cache."""
+        self.polygons
+        moved = basepoint is not None and basepoint != self.points[0]
+        previous = [0] + list(range(1, len(self.points))) # the index in self of each point of the result, None if it is new
+        if moved:
+            previous = [None] + previous[1:] + [0]
+        res = FundamentalGroupVoronoi(self.points[1:] + ([self.points[0]] if moved else []) + points, basepoint if moved else self.points[0], border=self.border)
+        previous += [None]*len(points)
+        logger.info("Inserting %d points in a Voronoi graph of %d points."% (len(res.points) - len(self.points), len(self.points)))
+
+        # an approximation is kept if the point did not get closer to the other points, or if its error is small compared to this distance
+        qpoints = []
+        for p, j, distance in zip(res.points, previous, res.nearest_distances):
+            if j != None and (distance >= self.nearest_distances[j] or 100*self.prec <= distance):
+                qpoints += [self.qpoints[j]]
+            else:
+                qpoints += [res.rationalize(p)]
+        res._qpoints = qpoints
+
+        if all([j == None or qpoints[i] == self.qpoints[j] for i, j in enumerate(previous)]) and res.border_points == self.border_points:
+            triangulation = copy.deepcopy(self._voronoi_diagram)
+            new = [i for i, j in enumerate(previous) if j == None]
+            try:
+                indices = triangulation.insert([res.complex_number_to_point(qpoints[i]) for i in new])
+            except ValueError:
+                return res
+            sites = [self._sites[j] if j != None else None for j in previous]
+            for i, k in zip(new, indices):
+                sites[i] = k
+            res._voronoi_diagram = triangulation
+            res._sites = sites
+        return res
+
+    def extend(self, points, basepoint=None):
+        """Returns the FundamentalGroupVoronoi of `points` with basepoint `basepoint` (by default the basepoint of self).
+        If the points of self (including the former basepoint if the basepoint changes) are among `points`, the new points are inserted with `insert_points`,
+        otherwise it is computed from scratch."""
+        moved = basepoint is not None and basepoint != self.points[0]
+        former = self.points if moved else self.points[1:]
+        closest = Util.select_closest_indices(points, former) if len(points) > 0 else []
+        matched = set([i for i, p in zip(closest, former) if abs(self.CC(points[i]) - self.CC(p)) < self.prec/100])
+        if len(matched) < len(former):
+            return FundamentalGroupVoronoi(points, basepoint if moved else self.points[0])
+        return self.insert_points([p for i, p in enumerate(points) if i not in matched], basepoint)
+
+
+    def _sort_loops_rec(self, v, parent=None, depth=0, loops_at=None):
+        if loops_at == None:
+            self.minimal_tree # the loops start at their loop points once the paths are computed
+            loops_at = {}
+            for i, loop in enumerate(self.loops):
+                loops_at.setdefault(loop[0], []).append((i, loop[1]))
         neighbours = self.neighbours(v)
-        tree_neighbours = self.minimal_tree.neighbors(v)
-        loops = [(i, loop[1]) for i, loop in enumerate(self.loops) if loop[0]==v]
+        loops = loops_at.get(v, [])
         if parent!=None:
             index = neighbours.index(parent)
             neighbours = neighbours[index:] + neighbours[:index]
 
         order = []
         for child in neighbours:
-            if child!= parent and child in tree_neighbours:
-                order+=self._sort_loops_rec(child, v, depth+1)
+            if child!= parent and self.minimal_tree.has_edge(v, child):
+                order+=self._sort_loops_rec(child, v, depth+1, loops_at)
             for loop in loops:
                 if loop[1] == child:
                     order+=[loop[0]]
@@ -258,77 +408,75 @@ class FundamentalGroupVoronoi(object):
 
 
     @property
-    def polygons(self): # this interfacing with VoronoiDiagram is so ugly
+    def border_points(self):
+        """The points added on a box around the critical values, so that their Voronoi cells are bounded."""
+        qpoints = [self.complex_number_to_point(z) for z in self.qpoints]
+        reals = [s[0] for s in qpoints]
+        imags = [s[1] for s in qpoints]
+        xmin, xmax, ymin, ymax = min(reals), max(reals), min(imags), max(imags)
+        shift = max(ymax-ymin, xmax-xmin)/2 # there is likely something more clever to do here
+        xmin, xmax, ymin, ymax = xmin - shift, xmax + shift, ymin - shift, ymax + shift
+
+        border_points = []
+        for i in range(self.border):
+            step = QQ(i)/QQ(self.border)
+            border_points += [xmin + step*(xmax-xmin) + I*ymax]
+            border_points += [xmax + step*(xmin-xmax) + I*ymin]
+            border_points += [xmin + I*(ymin + step*(ymax-ymin))]
+            border_points += [xmax + I*(ymax + step*(ymin-ymax))]
+        return border_points
+
+    def snap(self, x, y, radius, side):
+        """Rationalizes the Voronoi vertex x+I*y, circumcenter of a Delaunay triangle of circumradius `radius` whose shortest side has length `side`.
+        Its coordinates are rounded with a precision close to min(radius/16, side/100), so that the rational vertex remains far from the points
+        and the cells keep their shape. The precision only depends on the triangle, so that the vertex does not change when points are added away from it."""
+        bound = self.CC(min(radius/16, side/100)).real()
+        prec = Util.simple_rational(bound, bound/4)
+        return Util.simple_rational(self.CC(x).real(), prec) + I*Util.simple_rational(self.CC(y).real(), prec)
+
+    @property
+    def polygons(self):
         if not hasattr(self, "_polygons"):
             vertices = [self.qpoints[0]]
-            rootapprox = [p for p in self.qpoints] # there should be a `copy` function
-
-            qpoints = [self.complex_number_to_point(z) for z in self.qpoints]
-            reals = [s[0] for s in qpoints]
-            imags = [s[1] for s in qpoints]
-            xmin, xmax, ymin, ymax = min(reals), max(reals), min(imags), max(imags)
-            shift = max(ymax-ymin, xmax-xmin)/2 # there is likely something more clever to do here
-            xmin, xmax, ymin, ymax = xmin - shift, xmax + shift, ymin - shift, ymax + shift
-            
-            for i in range(self.border):
-                step = QQ(i)/QQ(self.border)
-                rootapprox += [xmin + step*(xmax-xmin) + I*ymax]
-                rootapprox += [xmax + step*(xmin-xmax) + I*ymin]
-                rootapprox += [xmin + I*(ymin + step*(ymax-ymin))]
-                rootapprox += [xmax + I*(ymax + step*(ymin-ymax))]
-            
-            list_of_rational_points = [] # why is this necessary? I do not know, but otherwise VoronoiDiagram throws a fit
-            for z in rootapprox:
-                p = self.complex_number_to_point(z)
-                list_of_rational_points+= [[QQ(p[0]), QQ([p[1]])]]
-
-            vd = VoronoiDiagram(list_of_rational_points)
-
-            self._voronoi_diagram = vd
-            self._rootapprox = rootapprox
-
-            polygons_temp = [] # first we collect all polygons and translate the centers in rational coordinates
-            for pt, reg in vd.regions().items():
-                center = Util.select_closest(rootapprox, self.rationalize(self.point_to_complex_number(pt.affine())))
-                
-                polygons_temp += [[center, reg]]
-
-            # we are only interested in cells around elements of self.points
-            indices = [Util.select_closest_index([center for center, polygon in polygons_temp], c) for c in self.qpoints]
-            polygons_temp = [polygons_temp[i] for i in indices]
-
-            # then we translate the edges in rational coordinate as well
+            index = {vertices[0]:0}
+            if not hasattr(self, "_voronoi_diagram"):
+                rootapprox = self.qpoints + self.border_points
+                self._voronoi_diagram = DelaunayTriangulation([self.complex_number_to_point(z) for z in rootapprox])
+                self._sites = list(range(len(self.qpoints)))
+            triangulation = self._voronoi_diagram
+
+            # the Voronoi vertices are the circumcenters of the Delaunay triangles, which we translate in rational coordinates
+            snapped = {}
             polygons = []
-            for center, polygon in polygons_temp:
+            for k, center in enumerate(self.qpoints):
+                cell = triangulation.voronoi_cell(self._sites[k])
+                for t in cell:
+                    if t not in snapped:
+                        z = self.snap(*triangulation.circumcenter(t), triangulation.shortest_side(t))
+                        if z not in index:
+                            index[z] = len(vertices)
+                            vertices += [z]
+                        snapped[t] = index[z]
                 edges = []
-                for edge in polygon.bounded_edges():
-                    e0 = self.rationalize(self.point_to_complex_number(edge[0]))
-                    if e0 not in vertices:
-                        vertices += [e0]
-                    e1 = self.rationalize(self.point_to_complex_number(edge[1]))
-                    if e1 not in vertices:
-                        vertices += [e1]
+                for t0, t1 in zip(cell, cell[1:] + cell[:1]):
+                    e0, e1 = snapped[t0], snapped[t1]
                     if e0 != e1:
-                        edges += [[vertices.index(e0),vertices.index(e1)]]
+                        edges += [[min(e0, e1), max(e0, e1)]]
                 polygons += [[center, edges]]
-            
+
             for i, polygon in enumerate(polygons):
                 center, edges = polygon
                 if center != self.points[0]:
                     continue
-                newedges = []
-                for edge in edges:
-                    for c, e2 in polygons:
-                        if c!=center and edge in e2:
-                            newedges += [edge]
-                            break
+                others = set([(e[0], e[1]) for c, e2 in polygons if c!=center for e in e2])
+                newedges = [edge for edge in edges if (edge[0], edge[1]) in others]
                 G = Graph(edges)
                 G2 = Graph(newedges)
                 while G2.connected_components_number()>1:
                     v1 = G2.connected_components()[0][0]
                     v2 = G2.connected_components()[1][0]
                     sp = G.shortest_path(v1, v2)
-                    edges = [sp[i:i+2] for i in range(len(sp)-1)]
+                    edges = [sorted(sp[i:i+2]) for i in range(len(sp)-1)]
                     for e in edges:
                         if e not in newedges:
                             newedges += [e]
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+# lefschetz-family
+# Copyright (C) 2021  Eric Pichon-Pharabod
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import sage.all
+
+from sage.parallel.ncpus import ncpus
+
+import logging
+import multiprocessing
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# the state held by each worker, set once when the worker is forked
+_worker = {}
+
+def _initialize(function, shared, shared_kwds):
+    _worker['function'] = function
+    _worker['shared'] = shared
+    _worker['shared_kwds'] = shared_kwds
+
+def _run(task):
+    index, args = task
+    begin = time.time()
+    result = _worker['function'](*_worker['shared'], *args, **_worker['shared_kwds'])
+    return index, result, time.time()-begin
+
+
+class WorkerPool(object):
+    def __init__(self, function, *shared, **shared_kwds):
+        """WorkerPool(function, *shared, **shared_kwds)
+
+        A pool of long-lived processes evaluating `function`.
+        The arguments `shared` and `shared_kwds` are given to the workers once, when they are forked,
+        so that a task only consists of the remaining arguments: `function(*shared, *args, **shared_kwds)` is computed for each task `args`.
+        The processes are started at the first batch of several tasks and kept for the next batches.
+        """
+        self._function = function
+        self._shared = shared
+        self._shared_kwds = shared_kwds
+        self._pool = None
+
+    @property
+    def nworkers(self):
+        return ncpus()
+
+    def _start(self, ntasks):
+        nworkers = min(self.nworkers, ntasks)
+        logger.info("[%d] Starting pool of %d workers."% (os.getpid(), nworkers))
+        context = multiprocessing.get_context("fork") # forking gives the shared arguments to the workers without pickling them
+        self._pool = context.Pool(nworkers, initializer=_initialize, initargs=(self._function, self._shared, self._shared_kwds))
+
+    def imap(self, tasks, timed=False):
+        """Given a list of tuples of arguments, yields the pairs (args, result) in the order in which the results are ready.
+        The tasks are started in the order in which they are given.
+        If `timed` is True, yields the triples (args, result, duration) instead."""
+        tasks = list(tasks)
+        if self._pool == None and (len(tasks)<=1 or multiprocessing.current_process().daemon): # the workers cannot have their own pool
+            for args in tasks:
+                begin = time.time()
+                result = self._function(*self._shared, *args, **self._shared_kwds)
+                yield (args, result, time.time()-begin) if timed else (args, result)
+            return
+        if self._pool == None:
+            self._start(len(tasks))
+        for index, result, duration in self._pool.imap_unordered(_run, list(enumerate(tasks))):
+            yield (tasks[index], result, duration) if timed else (tasks[index], result)
+
+    def close(self):
+        if self._pool != None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+    def __del__(self):
+        self.close()
@@ -0,0 +1,14 @@
+import pytest
+
+pytest.importorskip("sage.all")
+
+from lefschetz_family.context import Context
+
+
+def test_multiscale_rejects_singular():
+    with pytest.raises(ValueError, match="multiscale"):
+        Context(method="multiscale", singular=True)
+
+
+def test_multiscale():
+    assert Context(method="multiscale").method == "multiscale"
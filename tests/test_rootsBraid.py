@@ -0,0 +1,28 @@
+import pytest
+
+pytest.importorskip("sage.all")
+
+from sage.rings.polynomial.polynomial_ring_constructor import PolynomialRing
+from sage.rings.rational_field import QQ
+from sage.rings.complex_mpfr import ComplexField
+
+from lefschetz_family.rootsBraid import RootsBraid
+
+CC = ComplexField(50)
+
+
+@pytest.mark.parametrize("first", [[0, 1], [1, 0]])
+def test_braid_both_orientations(first):
+    """The braid along an edge goes from the roots at its start to the roots at its end, whichever orientation is requested first."""
+    R = PolynomialRing(QQ, ['u', 't'])
+    u, t = R.gens()
+    roots_braid = RootsBraid(t**3 - t - u, [[QQ(2), QQ(3)]]) # the discriminant vanishes at u = 2/sqrt(27) and -2/sqrt(27)
+    second = list(reversed(first))
+    for e in [first, second, first]:
+        braid = roots_braid.braid(e)
+        starts = sorted([CC(thread[0][1]) for thread in braid], key=lambda z: (z.real(), z.imag()))
+        ends = sorted([CC(thread[-1][1]) for thread in braid], key=lambda z: (z.real(), z.imag()))
+        for z, r in zip(starts, roots_braid.system(e[0])):
+            assert abs(z - r) < 1e-6
+        for z, r in zip(ends, roots_braid.system(e[1])):
+            assert abs(z - r) < 1e-6
@@ -0,0 +1,26 @@
+import pytest
+
+pytest.importorskip("sage.all")
+
+from sage.rings.rational_field import QQ
+from sage.rings.imaginary_unit import I
+from sage.rings.complex_mpfr import ComplexField
+
+from lefschetz_family.voronoi import FundamentalGroupVoronoi
+
+CC = ComplexField(50)
+
+POINTS = [QQ(3)+I, -2+2*I, QQ(1)/2-3*I, -1-I, 4-2*I, QQ(1)/3+QQ(5)/2*I, -3-QQ(5)/2*I, QQ(2)]
+
+
+def test_duality_after_sort_loops():
+    """The dual of an edge between two cells joins the points of these cells, also once the loops are sorted."""
+    fg = FundamentalGroupVoronoi(POINTS, QQ(-6)+I/7)
+    fg.sort_loops()
+    for e, d in fg.duality:
+        a, b = [CC(fg.vertices[v]) for v in e]
+        z = (a+b)/2
+        distances = [abs(CC(q) - z) for q in fg.qpoints]
+        others = [dist for k, dist in enumerate(distances) if k not in d]
+        # the rounding of the vertices can only matter for short edges
+        assert max([distances[k] for k in d]) <= min(others) + abs(b-a)